@@ -1,11 +1,15 @@
+import atexit
+import json
 import os
 from pathlib import Path
 import re
+import threading
 from typing import List
+from urllib.parse import urlencode
 
 import httpx
 from src.frames_util import timestamp_to_frame
-from src.load_configs import load_configs
+from src.load_configs import get_episodes, load_configs
 from tenacity import retry
 from tenacity import (
     RetryError,
@@ -15,6 +19,7 @@ from tenacity import (
 )
 
 from src.logger import get_logger
+from src.rate_limiter import RateLimiter
 
 logger = get_logger(__name__)
 
@@ -24,6 +29,45 @@ logger = get_logger(__name__)
 
 CONFIGS = load_configs()
 
+# patterns for the frame recommendations found in comments
+TIMESTAMP_RE = re.compile(r'\d{1,2}:\d{2}:\d{2}\.\d{2}')
+NUMBER_RE = re.compile(r'\d+')
+
+# One connection pool per API version, shared by every FacebookAPI instance
+# (poster, request_by, ...) so all Graph API calls reuse the same keep-alive connections.
+# HTTP/2 lets the photo and comment calls multiplex over a single TLS connection
+clients: dict[str, httpx.Client] = {}
+# poster and request_by call the API from thread pools, the first calls may race
+clients_lock = threading.Lock()
+
+
+@atexit.register
+def close_clients() -> None:
+    """Close the pooled connections when the process exits."""
+    for client in clients.values():
+        client.close()
+    clients.clear()
+
+
+def get_client(base_url: str) -> httpx.Client:
+    """Return the shared httpx.Client for base_url, creating it on first use.
+    The pools stay open for the whole run, close_clients() closes them at exit."""
+    with clients_lock:
+        if base_url not in clients:
+            clients[base_url] = httpx.Client(
+                base_url=base_url,
+                http2=True,
+                timeout=httpx.Timeout(30, connect=10),
+                limits=httpx.Limits(max_keepalive_connections=4, max_connections=8, keepalive_expiry=60),
+                headers={"User-Agent": "rand-frieren"},
+            )
+        return clients[base_url]
+
+
+# shared as well, so posts from poster and request_by are spaced against each other
+rate_limiter = RateLimiter()
+
+
 # Define a classe FacebookAPI para interagir com a API do Facebook
 # A classe é inicializada com a versão da API e o token de acesso
 
@@ -32,13 +76,26 @@ class FacebookAPI:
     def __init__(self, version: str = "v21.0"):
         self.base_url = f"https://graph.facebook.com/{version}/"
         self.access_token = os.getenv("FB_TOKEN", None)
-        self.client = httpx.Client(base_url=self.base_url, timeout=httpx.Timeout(30, connect=10))
 
-    # Verifica se o token de acesso foi definido
-    # Se não estiver definido, levanta um erro
-    if not os.getenv("FB_TOKEN"):
-        logger.error("FB_TOKEN not defined")
-        raise ValueError("FB_TOKEN not defined")
+        # Verifica se o token de acesso foi definido
+        # Se não estiver definido, levanta um erro
+        if not self.access_token:
+            logger.error("FB_TOKEN not defined")
+            raise ValueError("FB_TOKEN not defined")
+
+        self.client = get_client(self.base_url)
+        self.rate_limiter = rate_limiter
+
+    def warmup(self) -> None:
+        """
+        Open the connection to the Graph API with a lightweight request, so the next
+        upload doesn't pay for the TCP/TLS handshake. Failures are only logged.
+        """
+        try:
+            response = self.client.get("me", params={"fields": "id", "access_token": self.access_token})
+            self.rate_limiter.update(response.headers)
+        except httpx.HTTPError as e:
+            logger.warning(f"Graph API warmup failed: {e}")
 
     @retry(
         stop=stop_after_attempt(3),  # Máximo de 3 tentativas
@@ -50,8 +107,17 @@ class FacebookAPI:
         ),  # Só tenta novamente se for erro HTTP
         reraise=True,  # Lança exceção se todas as tentativas falharem
     )
-    def _try_post(self, endpoint: str, params: dict, files: dict = None) -> str | None:
-        response = self.client.post(endpoint, params=params, files=files)
+    def _try_post(self, endpoint: str, params: dict, frame: Path | bytes = None) -> str | None:
+        self.rate_limiter.wait()
+        # the file is opened here so each retry uploads it again from the start
+        if isinstance(frame, bytes):
+            response = self.client.post(endpoint, params=params, files={"source": ("frame.jpg", frame, "image/jpeg")})
+        elif frame:
+            with open(frame, "rb") as file:
+                response = self.client.post(endpoint, params=params, files={"source": (Path(frame).name, file, "image/jpeg")})
+        else:
+            response = self.client.post(endpoint, params=params)
+        self.rate_limiter.update(response.headers)
 
         if response.status_code == 200:
             try:
@@ -63,9 +129,10 @@ class FacebookAPI:
         response.raise_for_status()  # Levanta exceção para ativar retry
         return None
 
-    def post(self, message: str = "", frame_path: Path = None, parent_id: str = None) -> str | None:
+    def post(self, message: str = "", frame_path: Path | bytes = None, parent_id: str = None) -> str | None:
         """
         Posts a message to Facebook.
+        frame_path may also be the JPEG bytes of an image built in memory.
         If all attempts fail, only logs the error and returns None.
         """
         endpoint = (
@@ -74,23 +141,69 @@ class FacebookAPI:
             else f"{self.base_url}/me/photos"
         )
         params = {"access_token": self.access_token, "message": message}
-        files = None
 
+        try:
+            return self._try_post(endpoint, params, frame_path)
+        except RetryError:
+            logger.error("Failed to post after multiple attempts", exc_info=True)
+            return None
 
-        if not frame_path:
-            try:
-                return self._try_post(endpoint, params)
-            except RetryError:
-                logger.error("Failed to post after multiple attempts", exc_info=True)
-                return None
-        
-        with open(frame_path, "rb") as file:
-            files = {"source": file}
+    @retry(
+        stop=stop_after_attempt(3),
+        wait=wait_exponential(multiplier=1, min=2, max=10),
+        retry=retry_if_exception_type(httpx.HTTPError),
+        reraise=True,
+    )
+    def _try_batch(self, data: dict) -> list:
+        self.rate_limiter.wait()
+        response = self.client.post("", data=data)
+        self.rate_limiter.update(response.headers)
+        response.raise_for_status()  # Levanta exceção para ativar retry
+        return response.json()
+
+    def post_batch(self, requests: List[dict]) -> List[str | None]:
+        """
+        Send several Graph API requests in a single HTTP call.
+
+        Args:
+            requests: List of {"method", "relative_url", "body"} batch entries
+
+        Returns:
+            The id created by each request, in order, or None for the ones that failed.
+        """
+        data = {
+            "access_token": self.access_token,
+            "batch": json.dumps(requests),
+            "include_headers": "false",
+        }
+        try:
+            results = self._try_batch(data)
+        except (RetryError, httpx.HTTPError, ValueError):
+            logger.error("Failed to post batch after multiple attempts", exc_info=True)
+            return [None] * len(requests)
+
+        ids = []
+        for result in results:
+            # an entry is null when Facebook timed out processing that request
+            if not result or result.get("code") != 200:
+                logger.error(f"Batch request failed: {result}")
+                ids.append(None)
+                continue
             try:
-                return self._try_post(endpoint, params, files)
-            except RetryError:
-                logger.error("Failed to post after multiple attempts", exc_info=True)
-                return None
+                ids.append(json.loads(result.get("body", "{}")).get("id"))
+            except ValueError:
+                logger.error(f"Batch response does not contain valid JSON: {result}")
+                ids.append(None)
+        return ids
+
+    @staticmethod
+    def comment_request(parent_id: str, message: str) -> dict:
+        """Build the batch entry that comments message on parent_id."""
+        return {
+            "method": "POST",
+            "relative_url": f"{parent_id}/comments",
+            "body": urlencode({"message": message}),
+        }
 
     # recommendations functions
     def get_posts(self, attempts: int = 6) -> List[dict]:
@@ -103,8 +216,10 @@ class FacebookAPI:
         Returns:
             List of post data dictionaries
         """
+        # pages come from cursors, so they can only be fetched one after the other;
+        # asking just for the comment messages keeps each page small
         params = {
-            'fields': 'message,comments.limit(100)',
+            'fields': 'comments.limit(100){message}',
             'limit': '100',
             'access_token': self.access_token
         }
@@ -169,9 +284,7 @@ class FacebookAPI:
                 value = parts[1]
 
                 if len(parts) > 2:
-                    user_name = parts[2]
-                    if len(user_name) > 150:
-                        user_name = user_name[:150].strip()
+                    user_name = parts[2].strip()[:150]
                 else:
                     user_name = 'unknown'
 
@@ -179,22 +292,24 @@ class FacebookAPI:
                     logger.warning(f"Invalid comment format: {comment}")
                     continue
 
-                episode_num = int(re.search(r'\d+', episode).group(0))
+                episode_num = int(NUMBER_RE.search(episode).group(0))
 
-                if re.search(r'\d{1,2}:\d{2}:\d{2}\.\d{2}', value):
-                    frame = timestamp_to_frame(re.search(r'\d{1,2}:\d{2}:\d{2}\.\d{2}', value).group(0))
+                timestamp_match = TIMESTAMP_RE.search(value)
+                if timestamp_match:
+                    frame = timestamp_to_frame(timestamp_match.group(0))
                 else:
-                    frame = int(re.search(r'\d+', value).group(0))
+                    frame = int(NUMBER_RE.search(value).group(0))
 
 
 
                 # check if episode_num is in configs
-                if episode_num not in CONFIGS.get('episodes', {}):
+                episode_data = get_episodes(CONFIGS).get(episode_num)
+                if episode_data is None:
                     logger.warning(f"Episode {episode_num} not found in configs")
                     continue
 
                 # check if frame is in range of episode
-                if frame < 1 or frame > CONFIGS.get('episodes', {}).get(episode_num, {}).get('number_of_frames', 0):
+                if frame < 1 or frame > episode_data.number_of_frames:
                     logger.warning(f"Frame {frame} is out of range for episode {episode_num}")
                     continue
 
@@ -210,7 +325,17 @@ class FacebookAPI:
                 continue
 
         return frames
-    
 
 
+# created on first use instead of at import, so importing a module doesn't need FB_TOKEN
+api: FacebookAPI | None = None
+api_lock = threading.Lock()
+
 
+def get_api() -> FacebookAPI:
+    """Return the FacebookAPI shared by poster and request_by (safe to call from any thread)."""
+    global api
+    with api_lock:
+        if api is None:
+            api = FacebookAPI()
+        return api
@@ -3,104 +3,126 @@ Filters module contains functions for applying filters to frames.
 """
 
 # Standard library imports
+from functools import lru_cache
+from io import BytesIO
 from pathlib import Path
 import random
-from PIL import Image, ImageEnhance
+from PIL import Image, ImageChops
 from typing import Optional
 
 # Third party imports
+from src.load_configs import filter_weights
 from src.logger import get_logger
 
-# Define output directory for processed images
-OUTPUT_DIR = Path.cwd() / "images"
-
 # Initialize logger
 logger = get_logger(__name__)
 
 
+# Facebook recompresses every upload, so the encoder is kept on its fast path:
+# 4:2:0 subsampling, no extra Huffman optimization pass, baseline (not progressive)
+JPEG_OPTIONS = {"format": "JPEG", "quality": 85, "subsampling": 2, "optimize": False, "progressive": False}
+
+
+def encode_jpeg(img: Image.Image) -> bytes:
+    """
+    Encode a filtered image as JPEG in memory.
+    The bytes are uploaded as is, so the result never goes through the disk.
+    """
+    buffer = BytesIO()
+    img.save(buffer, **JPEG_OPTIONS)
+    return buffer.getvalue()
+
+
 def none_filter(frame_path: Path) -> Path:
     """Returns the original frame without applying any filter."""
     return frame_path
 
 
-def two_panels(frame_path1: Path, frame_path2: Path) -> Path:
+def two_panels(frame_path1: Path, frame_path2: Path) -> Optional[bytes]:
     try:
         with Image.open(frame_path1) as img1, Image.open(frame_path2) as img2:
             image_width, image_height = img1.size
+            # black background, shows if the second frame is smaller than the first
             img3 = Image.new("RGB", (image_width, image_height * 2))
             img3.paste(img1, (0, 0))
             img3.paste(img2, (0, image_height))
 
-            output_path = OUTPUT_DIR / "_two_panels.jpg"
-            output_path.parent.mkdir(parents=True, exist_ok=True)
-            img3.save(output_path)
-            logger.info(f"Saved two-panels image to {output_path}")
-            return output_path
+            logger.info(f"Built two-panels image from {frame_path1} and {frame_path2}")
+            return encode_jpeg(img3)
     except IOError as e:
         logger.error(f"IOError while processing two-panels image: {e}")
         return None
 
 
-def mirror(frame_path) -> Path:
+def mirror(frame_path) -> Optional[bytes]:
     """Mirrors the left or right side of the image randomly."""
     try:
         with Image.open(frame_path) as img:
+            img = img.convert("RGB")
             width, height = img.size
-            output_img = Image.new("RGB", (width, height))
+            # the flipped image already holds the mirrored half, only the kept half is pasted back
+            output_img = img.transpose(Image.FLIP_LEFT_RIGHT)
 
             if random.choice([True, False]):
-                half = img.crop((0, 0, width // 2, height))
-                mirrored_half = half.transpose(Image.FLIP_LEFT_RIGHT)
-                output_img.paste(half, (0, 0))
-                output_img.paste(mirrored_half, (width // 2, 0))
+                output_img.paste(img.crop((0, 0, width // 2, height)), (0, 0))
             else:
-                half = img.crop((width // 2, 0, width, height))
-                mirrored_half = half.transpose(Image.FLIP_LEFT_RIGHT)
-                output_img.paste(mirrored_half, (0, 0))
-                output_img.paste(half, (width // 2, 0))
-
-        output_path = OUTPUT_DIR / "_mirror.jpg"
-        output_path.parent.mkdir(parents=True, exist_ok=True)
-        output_img.save(output_path)
-        logger.info(f"Saved mirrored image to {output_path}")
-        return output_path
+                output_img.paste(img.crop((width // 2, 0, width, height)), (width // 2, 0))
+
+        logger.info(f"Built mirrored image from {frame_path}")
+        return encode_jpeg(output_img)
     except IOError as e:
         logger.error(f"IOError while processing mirror image: {e}")
         return None
 
 
-def brightness_contrast(frame_path: Path, brightness: float = 0.8, contrast: float = 1.5) -> Path:
+@lru_cache(maxsize=256)
+def brightness_contrast_lut(brightness: float, contrast: float, mean: int) -> tuple[int, ...]:
+    """
+    Brightness and contrast fused into one 256-entry table per band, so the image
+    is walked once by img.point instead of twice by ImageEnhance.
+    Same math as ImageEnhance: brightness scales towards black, contrast towards
+    the mean grey level of the brightened image.
+    Cached, since brightness/contrast are fixed and the mean only has 256 values.
+    """
+    table = []
+    for value in range(256):
+        value = min(255, value * brightness)
+        value = mean + (value - mean) * contrast
+        table.append(max(0, min(255, int(value + 0.5))))
+    return tuple(table * 3)
+
+
+def brightness_contrast(frame_path: Path, brightness: float = 0.8, contrast: float = 1.5) -> Optional[bytes]:
     """Applies a brightness and contrast filter to an image."""
     input_path = Path(frame_path)
 
     if not input_path.exists():
         return None
-    
-    output_path = OUTPUT_DIR / "_brightness_contrast.jpg"
 
     try:
         with Image.open(input_path) as img:
-            img = ImageEnhance.Brightness(img).enhance(brightness)
-            img = ImageEnhance.Contrast(img).enhance(contrast)
-            img.save(output_path)
-            logger.info(f"Saved brightness/contrast image to {output_path}")
-        return output_path
+            img = img.convert("RGB")
+            # mean grey level after the brightness step, as ImageEnhance.Contrast would see it
+            histogram = img.convert("L").histogram()
+            mean = sum(level * count for level, count in enumerate(histogram)) / sum(histogram)
+            mean = int(min(255, mean * brightness) + 0.5)
+
+            img = img.point(brightness_contrast_lut(brightness, contrast, mean))
+            logger.info(f"Built brightness/contrast image from {input_path}")
+            return encode_jpeg(img)
     except IOError as e:
         logger.error(f"IOError while processing brightness/contrast image: {e}")
         return None
 
 
-def negative(frame_path) -> Path:
+def negative(frame_path) -> Optional[bytes]:
     """Applies a negative filter."""
     try:
         with Image.open(frame_path) as img:
-            output_img = img.convert("RGB").point(lambda x: 255 - x)
+            output_img = ImageChops.invert(img.convert("RGB"))
 
-        output_path = OUTPUT_DIR / "_negative.jpg"
-        output_path.parent.mkdir(parents=True, exist_ok=True)
-        output_img.save(output_path)
-        logger.info(f"Saved negative image to {output_path}")
-        return output_path
+        logger.info(f"Built negative image from {frame_path}")
+        return encode_jpeg(output_img)
     except IOError as e:
         logger.error(f"IOError while processing negative image: {e}")
         return None
@@ -115,56 +137,26 @@ filter_registry = {
 }
 
 
-def apply_filter(filter_func, Framedata: list[dict]) -> Optional[Path]:
-    """Apply a filter to the frame and return the path of the filtered frame."""
-
-    if not isinstance(Framedata, list) or not all(isinstance(item, dict) for item in Framedata):
-        logger.error("✖ Invalid Framedata format")
-        return None
-
-    if len(Framedata) == 2 and all('frame_path' in item for item in Framedata):
-        try:
-            output_path = filter_func(Framedata[0]['frame_path'], Framedata[1]['frame_path'])
-            if output_path:
-                return output_path
-            else:
-                logger.error("✖ Failed to apply filter")
-        except Exception as e:
-            logger.error(f"✖ Error applying filter: {e}")
-            return None
-
-    if len(Framedata) == 1 and 'frame_path' in Framedata[0]:
-        try:
-            output_path = filter_func(Framedata[0]['frame_path'])
-            if output_path:
-                return output_path
-            else:
-                logger.error("✖ Failed to apply filter")
-        except Exception as e:
-            logger.error(f"✖ Error applying filter: {e}")
-            return None
+def apply_filter(filter_func, framedata: list[dict]) -> Optional[Path | bytes]:
+    """
+    Apply a filter to the frame(s) and return the filtered frame: the JPEG bytes
+    built by the filter, or the original path when the filter leaves it unchanged.
+    Each frame is passed as one argument (two_panels takes two, the others one),
+    so a wrong number of frames raises instead of failing silently.
+    """
+    output = filter_func(*(data["frame_path"] for data in framedata))
+    if not output:
+        logger.error("✖ Failed to apply filter")
+    return output
 
-    logger.error("✖ Invalid Framedata structure or missing keys")
-    return None
 
 def select_filter(configs: dict) -> callable:
     """
     Select an enabled filter based on the configuration and their respective weights.
     """
-    active_filters = {}
-    filters_config = configs.get("filters", {})
-    
-    for filter_name, filter_settings in filters_config.items():
-        if isinstance(filter_settings, dict) and filter_settings.get("enabled", False):
-            active_filters[filter_name] = filter_settings.get("percent", 0)
-
-    if not active_filters:
+    names, cum_weights = filter_weights(configs)
+    if not names:
         return filter_registry['none_filter']
 
-    selected_filter = random.choices(
-        list(active_filters.keys()), 
-        weights=list(active_filters.values()), 
-        k=1
-    )[0]
-
+    selected_filter = random.choices(names, cum_weights=cum_weights, k=1)[0]
     return filter_registry[selected_filter]
@@ -1,94 +1,176 @@
+from bisect import bisect_right, insort
 import json
 from pathlib import Path
-from typing import Set, Tuple
+from typing import Dict, List, Set, Tuple
 
 class FrameHistory:
     """
     Manages the history of used frames, persisting it between executions.
-    Automatically clears history when reaching 1000 frames.
+    Automatically clears history when reaching MAX_FRAMES frames.
+
+    The history is an append-only file with one "episode,frame" line per used frame,
+    so adding a frame writes a single line instead of rewriting the whole history.
+
+    Frames picked but not posted yet are reserved in memory only, so concurrent picks
+    skip them while a run that stops before posting them doesn't count them as used.
     """
     MAX_FRAMES = 5000
+    FRAME_BITS = 20 # (episode, frame) pairs are packed as episode << FRAME_BITS | frame
+    LEGACY_FILE = "frame_history.json" # format used before the append-only file
 
-    def __init__(self, history_file: str = "frame_history.json"):
+    def __init__(self, history_file: str = "frame_history.csv"):
         self.history_file = Path.cwd() / "temp" / history_file
-        self.used_frames: Set[Tuple[int, int]] = set()
-        
+        self.used_frames: Set[int] = set() # packed with _key, one int per frame instead of a tuple
+        self.reserved_frames: Set[int] = set() # picked in this run, not saved until posted
+        # sorted used and reserved frames of each episode, to pick unused frames directly
+        self.used_by_episode: Dict[int, List[int]] = {}
+        self._lines = 0 # lines in the file, may exceed used_frames if a frame was added twice
+
         # Create temp directory if it doesn't exist
         self.history_file.parent.mkdir(parents=True, exist_ok=True)
         self._load_history()
 
+    @classmethod
+    def _key(cls, episode_number: int, frame_number: int) -> int:
+        """Pack an (episode, frame) pair into a single int."""
+        return episode_number << cls.FRAME_BITS | frame_number
+
+    @classmethod
+    def _unpack(cls, key: int) -> Tuple[int, int]:
+        """Inverse of _key: return the (episode, frame) pair."""
+        return key >> cls.FRAME_BITS, key & ((1 << cls.FRAME_BITS) - 1)
+
     def _load_history(self) -> None:
         """
-        Load the frame history from the JSON file.
-        Creates the file and directory if they don't exist.
+        Load the frame history from the file.
+        Migrates the old JSON history the first time, and creates the file if it doesn't exist.
         """
-        # Create the file if it doesn't exist
-        self.history_file.touch(exist_ok=True)
-        
+        legacy_file = self.history_file.with_name(self.LEGACY_FILE)
+
         if self.history_file.exists():
+            with open(self.history_file, 'r') as f:
+                for line in f:
+                    episode, _, frame = line.partition(",")
+                    try:
+                        self.used_frames.add(self._key(int(episode), int(frame)))
+                        self._lines += 1
+                    except ValueError:
+                        continue # e.g. a line cut short by an interrupted write
+        elif legacy_file.exists():
             try:
-                with open(self.history_file, 'r') as f:
-                    data = json.load(f)
-                    # Convert the list of lists back to set of tuples
-                    self.used_frames = {(item[0], item[1]) for item in data}
+                with open(legacy_file, 'r') as f:
+                    self.used_frames = {self._key(item[0], item[1]) for item in json.load(f)}
             except json.JSONDecodeError:
                 self.used_frames = set()
+            self._save_history()
         else:
-            self.used_frames = set()
             self._save_history()
 
+        for episode, frame in map(self._unpack, self.used_frames):
+            self.used_by_episode.setdefault(episode, []).append(frame)
+        for frames in self.used_by_episode.values():
+            frames.sort()
+
     def _save_history(self) -> None:
         """
-        Save the current frame history to the JSON file.
-        Formats the output with indentation and line breaks for better readability.
+        Rewrite the whole history file from the frames in memory.
+        Only needed to compact the file or after clearing it; add_frame appends.
         """
-        # Convert set of tuples to list of lists for JSON serialization
-        data = [list(item) for item in self.used_frames]
         with open(self.history_file, 'w') as f:
-            json.dump(data, f, indent=4)
+            f.writelines(f"{episode},{frame}\n" for episode, frame in map(self._unpack, self.used_frames))
+        self._lines = len(self.used_frames)
+
+    def _append_history(self, episode_number: int, frame_number: int) -> None:
+        """Append a single frame to the history file."""
+        with open(self.history_file, 'a') as f:
+            f.write(f"{episode_number},{frame_number}\n")
+        self._lines += 1
 
     def add_frame(self, frame_number: int, episode_number: int) -> None:
         """
         Add a frame to the history and save it.
         If the history reaches MAX_FRAMES, it will be automatically cleared.
-        
+
         Args:
             frame_number (int): The frame number
             episode_number (int): The episode number
         """
-        self.used_frames.add((episode_number, frame_number))
-        
+        key = self._key(episode_number, frame_number)
+        if key not in self.used_frames and key not in self.reserved_frames:
+            insort(self.used_by_episode.setdefault(episode_number, []), frame_number)
+        self.used_frames.add(key)
+        self.reserved_frames.discard(key)
+
         # Check if we need to clear the history
         if len(self.used_frames) >= self.MAX_FRAMES:
             self.clear_history()
+        elif self._lines >= 2 * len(self.used_frames):
+            self._save_history() # too many duplicated lines, compact the file
         else:
-            self._save_history()
+            self._append_history(episode_number, frame_number)
+
+    def reserve_frame(self, frame_number: int, episode_number: int) -> None:
+        """
+        Mark a frame as taken for this run without saving it; add_frame saves it once posted.
+
+        Args:
+            frame_number (int): The frame number
+            episode_number (int): The episode number
+        """
+        key = self._key(episode_number, frame_number)
+        if key not in self.used_frames and key not in self.reserved_frames:
+            insort(self.used_by_episode.setdefault(episode_number, []), frame_number)
+            self.reserved_frames.add(key)
 
     def is_frame_used(self, episode_number: int, frame_number: int) -> bool:
         """
         Check if a frame has been used before.
-        
+
         Args:
             frame_number (int): The frame number to check
             episode_number (int): The episode number to check
-            
+
         Returns:
             bool: True if the frame has been used, False otherwise
         """
-        return (episode_number, frame_number) in self.used_frames
+        return self._key(episode_number, frame_number) in self.used_frames
 
     def clear_history(self) -> None:
         """
         Clear the frame history and save the empty state.
         """
         self.used_frames.clear()
+        self.used_by_episode.clear()
+        # frames reserved by this run are still being posted
+        for episode, frame in map(self._unpack, self.reserved_frames):
+            insort(self.used_by_episode.setdefault(episode, []), frame)
         self._save_history()
 
+    def unused_frames_count(self, episode_number: int, number_of_frames: int) -> int:
+        """Number of frames in 1..number_of_frames of the episode that were not used yet."""
+        used = self.used_by_episode.get(episode_number, [])
+        return number_of_frames - bisect_right(used, number_of_frames)
+
+    def nth_unused_frame(self, episode_number: int, number_of_frames: int, n: int) -> int:
+        """
+        Return the n-th (0-based) unused frame of the episode, in frame order.
+        Binary search on frame - used_frames_up_to(frame), O(log^2) instead of scanning.
+        """
+        used = self.used_by_episode.get(episode_number, [])
+        low, high = 1, number_of_frames
+        while low < high:
+            middle = (low + high) // 2
+            if middle - bisect_right(used, middle) > n:
+                high = middle
+            else:
+                low = middle + 1
+        return low
+
     def get_used_frames_count(self) -> int:
         """
         Get the total number of frames that have been used.
-        
+
         Returns:
             int: The number of used frames
         """
-        return len(self.used_frames) 
\ No newline at end of file
+        return len(self.used_frames)
@@ -1,6 +1,9 @@
-from datetime import datetime, timedelta
+import atexit
+from functools import lru_cache
+from io import BytesIO
 from pathlib import Path
 import random
+import threading
 import time
 from typing import Optional
 
@@ -8,30 +11,90 @@ from PIL import Image
 import httpx
 from tenacity import retry, stop_after_attempt, wait_exponential, retry_if_exception_type
 
+from src.filters import JPEG_OPTIONS
+from src.http_client import client
+from src.load_configs import frame_url_templates, get_episodes
 from src.logger import get_logger
 from src.frame_history import FrameHistory
 
 logger = get_logger(__name__)
 
-# Initialize the HTTP client with a timeout and headers
-# The timeout is set to 30 seconds for the entire request and 10 seconds for the connection
-client = httpx.Client(
-    timeout=httpx.Timeout(30, connect=10),
-    headers={
-        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64)'
-        'AppleWebKit/537.36 (KHTML, like Gecko) Chrome/135.0.0.0 Safari/537.36'})
+# created once here instead of on every download
+IMAGES_DIR = Path.cwd() / "images"
+IMAGES_DIR.mkdir(parents=True, exist_ok=True)
+
+# frames written by this process: reused if the same frame is asked again in this run
+# (e.g. recommended twice) and removed at exit, files left by other runs are never trusted
+downloaded_frames: set[Path] = set()
+
+
+def remove_downloaded_frames() -> None:
+    """Delete the frames downloaded by this run, they are only needed until posted."""
+    for frame_path in list(downloaded_frames):
+        frame_path.unlink(missing_ok=True)
+    downloaded_frames.clear()
+
+
+atexit.register(remove_downloaded_frames)
+
+# Downloads from GitHub raw are spaced by DOWNLOAD_INTERVAL across all threads,
+# only waiting when requests come in faster than that
+DOWNLOAD_INTERVAL = 1.0 # seconds, the rate of the old fixed time.sleep(1) between downloads
+download_slot_lock = threading.Lock()
+next_download_slot = 0.0
+
+
+def wait_download_slot() -> None:
+    """Block until the next download slot; returns immediately if the last one is old enough."""
+    global next_download_slot
+    with download_slot_lock:
+        now = time.monotonic()
+        delay = max(0.0, next_download_slot - now)
+        next_download_slot = max(now, next_download_slot) + DOWNLOAD_INTERVAL
+    if delay:
+        time.sleep(delay)
+
 
 # Initialize frame history
 frame_history = FrameHistory()
+# get_random_frame can be called from worker threads, check-and-add must be atomic
+frame_history_lock = threading.Lock()
+
+
+def stream_to_file(response: httpx.Response, path: Path) -> bytes:
+    """
+    Write a streamed response body to path as it arrives, and return the body.
+    The bytes are kept as well since an unfiltered frame is uploaded from them.
+    The file only gets its name once complete, so a frame found on disk is never a partial download.
+    """
+    chunks = []
+    partial_path = path.with_name(path.name + ".part")
+    with open(partial_path, "wb") as file:
+        for chunk in response.iter_bytes(chunk_size=65536):
+            file.write(chunk)
+            chunks.append(chunk)
+    partial_path.replace(path)
+    return b"".join(chunks)
+
+
+def save_frame(response: httpx.Response, frame_path: Path) -> tuple[Path, bytes]:
+    """Stream a downloaded frame to frame_path and remember it as downloaded by this run."""
+    frame_bytes = stream_to_file(response, frame_path)
+    downloaded_frames.add(frame_path)
+    return frame_path, frame_bytes
+
 
 @retry(
     stop=stop_after_attempt(3),
     wait=wait_exponential(multiplier=1, min=4, max=60),
     retry=retry_if_exception_type((httpx.RequestError, httpx.HTTPStatusError))
 )
-def download_frame(configs: dict, frame_number: int, episode_number: int) -> Optional[Path]:
+def download_frame(configs: dict, frame_number: int, episode_number: int) -> Optional[tuple[Path, bytes]]:
     """
     Download a frame from the specified episode and frame number.
+    The frame is saved for the filters, and its bytes are returned too so an
+    unfiltered frame is uploaded without reading the file back.
+    A frame already downloaded by this process (e.g. recommended twice) is read from disk instead.
     Implements exponential backoff for rate limiting and network errors.
     Returns None if all retry attempts fail.
 
@@ -41,43 +104,44 @@ def download_frame(configs: dict, frame_number: int, episode_number: int) -> Opt
         episode_number (int): The episode number to download from.
 
     Returns:
-        Optional[Path]: The path to the downloaded frame, or None if all retry attempts fail.
+        Optional[tuple[Path, bytes]]: The path and the content of the downloaded frame,
+        or None if all retry attempts fail.
     """
     try:
-        username = configs.get("github", {}).get("username")
-        repo = configs.get("github", {}).get("repo")
-        branch = configs.get("episodes", {}).get(episode_number, {}).get("branch")
-        frames_dir = configs.get("episodes", {}).get(episode_number, {}).get("frames_dir")
-
-        if not all([username, repo, branch, frames_dir]):
+        url_template = frame_url_templates(configs).get(episode_number)
+        if not url_template:
             logger.error("Error: Missing required configuration values for download subtitle", exc_info=True)
             return None
 
-        frame_url = f'https://raw.githubusercontent.com/{username}/{repo}/{branch}/{frames_dir:02d}/{frame_number:04d}.jpg'
-        
-        # Add a small delay before each request to avoid rate limiting
-        time.sleep(1)
-        
-        response = client.get(frame_url)
-   
-        if response.status_code == 429:
-            proxy_url = f'https://images.weserv.nl/?url={frame_url}'
-            response = client.get(proxy_url)
+        # episode in the name so frames downloaded concurrently never overwrite each other
+        frame_path = IMAGES_DIR / f"{episode_number:02d}_{frame_number:04d}.jpg"
 
-        if not response.status_code == 200:
-            logger.error(
-                f"HTTP error while downloading frame {frame_number} from episode {episode_number}: "
-                f"{response.status_code} - {response.text}", exc_info=True
-                )
-            return None
+        # downloaded earlier in this run, from the same configs
+        if frame_path in downloaded_frames:
+            return frame_path, frame_path.read_bytes()
 
-        images_dir = Path.cwd() / "images"
-        images_dir.mkdir(parents=True, exist_ok=True)
+        frame_url = url_template.format(frame=frame_number)
+        
+        # Space the requests to avoid rate limiting
+        wait_download_slot()
 
-        frame_path = images_dir / f"{frame_number:04d}.jpg"
-        frame_path.write_bytes(response.content)
+        with client.stream("GET", frame_url) as response:
+            if response.status_code == 200:
+                return save_frame(response, frame_path)
+            response.read()
 
-        return frame_path
+        if response.status_code == 429:
+            proxy_url = f'https://images.weserv.nl/?url={frame_url}'
+            with client.stream("GET", proxy_url) as response:
+                if response.status_code == 200:
+                    return save_frame(response, frame_path)
+                response.read()
+
+        logger.error(
+            f"HTTP error while downloading frame {frame_number} from episode {episode_number}: "
+            f"{response.status_code} - {response.text}", exc_info=True
+            )
+        return None
     except httpx.RequestError as e:
         logger.error(f"Request error while downloading frame {frame_number} from episode {episode_number}: {e}", exc_info=True)
         if not isinstance(e, httpx.HTTPStatusError) or e.response.status_code != 429:
@@ -97,7 +161,8 @@ def download_frame(configs: dict, frame_number: int, episode_number: int) -> Opt
 def get_random_frame(configs: dict) -> tuple[int, int] | None:
     """
     Select a random frame from the episodes configuration.
-    Avoids returning frames that have been used before.
+    Avoids returning frames that have been used before. The frame is only reserved for
+    this run, save_posted_frame adds it to the history once it has been posted.
 
     Args:
         configs (dict): Configuration dictionary containing episode data.
@@ -106,54 +171,67 @@ def get_random_frame(configs: dict) -> tuple[int, int] | None:
         tuple[int, int] | None: A tuple containing the random frame number and episode number.
         Returns None if no valid frame is found or if all frames have been used.
     """
-    episodes: dict = configs.get("episodes", {})
+    episodes = get_episodes(configs)
     if not episodes:
         logger.error(f"No episodes found in the configuration.")
         return None
 
-    # Try to find an unused frame
-    max_attempts = 500  # Prevent infinite loops
-    attempts = 0
-    
-    while attempts < max_attempts:
-        random_episode_key = random.choice(list(episodes.keys()))
-        episode_data: dict = episodes.get(random_episode_key, {})
-        number_of_frames = episode_data.get("number_of_frames", 0)
-
-        if number_of_frames <= 0:
-            logger.error(f"No frames available in episode {random_episode_key}.", exc_info=True)
+    # Sample directly among the unused frames: count them per episode, draw one index
+    # and find that frame, instead of retrying random frames that are already used
+    with frame_history_lock:
+        unused = []
+        for episode_number, episode_data in episodes.items():
+            number_of_frames = episode_data.number_of_frames
+            if number_of_frames <= 0:
+                # the other episodes can still be sampled
+                logger.warning(f"No frames available in episode {episode_number}, skipping it.")
+                continue
+
+            unused.append((episode_number, number_of_frames, frame_history.unused_frames_count(episode_number, number_of_frames)))
+
+        total_unused = sum(count for _, _, count in unused)
+        if not total_unused:
+            logger.warning(f"All frames have been used.")
             return None
 
-        frame_number = random.randint(1, number_of_frames)
-        episode_number = int(random_episode_key)
-        
-        if not frame_history.is_frame_used(frame_number, episode_number):
-            frame_history.add_frame(frame_number, episode_number)
-            return frame_number, episode_number
-            
-        attempts += 1
+        index = random.randrange(total_unused)
+        for episode_number, number_of_frames, count in unused:
+            if index < count:
+                frame_number = frame_history.nth_unused_frame(episode_number, number_of_frames, index)
+                frame_history.reserve_frame(frame_number, episode_number)
+                return frame_number, episode_number
+            index -= count
 
-    logger.warning(f"Could not find an unused frame after maximum attempts.")
     return None
 
-   
-def random_crop(frame_path: Path, configs: dict) -> tuple[Path, str] | None:
+
+def save_posted_frame(frame_number: int, episode_number: int) -> None:
+    """Add a frame returned by get_random_frame to the history, once it was posted."""
+    with frame_history_lock:
+        frame_history.add_frame(frame_number, episode_number)
+
+
+def random_crop(frame_path: Path | bytes, configs: dict) -> tuple[bytes, str] | None:
     """
     Returns a random crop of the frame.
+    The crop is encoded in memory and uploaded from its bytes, it is never written to disk.
 
     Args:
-        frame_path: Path to the frame image.
+        frame_path: Path to the frame image, or the JPEG bytes of a filtered frame.
 
     Returns:
-        tuple[Path, str]: Tuple containing the path to the cropped image and the crop coordinates.
+        tuple[bytes, str]: Tuple containing the JPEG bytes of the cropped image and the crop coordinates.
     """
-    if not isinstance(frame_path, Path):
+    if isinstance(frame_path, bytes):
+        source = BytesIO(frame_path)
+    elif not isinstance(frame_path, Path):
         logger.error(f"frame_path must be a Path object ", exc_info=True)
         return None, None
-
-    if not frame_path.is_file():
+    elif not frame_path.is_file():
         logger.error(f"frame_path must be a file", exc_info=True)
         return None, None
+    else:
+        source = frame_path
 
     try:
         min_x: int = configs.get("posting", {}).get("random_crop", {}).get("min_x", 200)
@@ -162,11 +240,11 @@ def random_crop(frame_path: Path, configs: dict) -> tuple[Path, str] | None:
         # Random crop dimensions. perfect square.
         crop_width = crop_height = random.randint(min_x, min_y)
 
-        with Image.open(frame_path) as img:
+        with Image.open(source) as img:
             image_width, image_height = img.size
 
             if image_width < crop_width or image_height < crop_height:
-                logger.error(f"Image {frame_path} is too small for the crop size.", exc_info=True)
+                logger.error(f"Image ({image_width}x{image_height}) is too small for the crop size {crop_width}.", exc_info=True)
                 return None, None
 
             # Generate random crop coordinates
@@ -178,20 +256,14 @@ def random_crop(frame_path: Path, configs: dict) -> tuple[Path, str] | None:
                 (crop_x, crop_y, crop_x + crop_width, crop_y + crop_height)
             )
 
-            # Save the cropped image
-            cropped_path = (
-                Path.cwd()
-                / "temp"
-                / f"cropped_frame{frame_path.suffix}"
-            )
-            cropped_path.parent.mkdir(exist_ok=True)
-
-            cropped_img.save(cropped_path)
+            # Encode the cropped image
+            buffer = BytesIO()
+            cropped_img.save(buffer, **JPEG_OPTIONS)
             message = (
                 f"Random Crop. [{crop_width}x{crop_height} ~ X: {crop_x}, Y: {crop_y}]"
             )
 
-            return cropped_path, message
+            return buffer.getvalue(), message
 
     except Exception as e:
         logger.error(f"Failed to crop image: {str(e)}", exc_info=True)
@@ -219,8 +291,10 @@ def timestamp_to_seconds(time_str: str) -> float:
     except ValueError:
         raise ValueError("Invalid time format. Expected HH:MM:SS.mmm.")
 
+@lru_cache(maxsize=4096)
 def frame_to_timestamp(img_fps: int | float, current_frame: int) -> str:
     """Convert frame number to timestamp.
+    Results are memoized by (img_fps, current_frame).
     
     Args:
         img_fps (int | float): Frames per second of the video.
@@ -238,14 +312,12 @@ def frame_to_timestamp(img_fps: int | float, current_frame: int) -> str:
         return None  # FPS zero ou frame negativo não são válidos
 
     try:
-        # Converte o número do frame para o timestamp
-        frame_timestamp = datetime(1900, 1, 1) + timedelta(seconds=current_frame / img_fps)
-        hr, min, sec, ms = (
-            frame_timestamp.hour,
-            frame_timestamp.minute,
-            frame_timestamp.second,
-            frame_timestamp.microsecond // 10000,
-        )
+        # Converte o número do frame para o timestamp, em inteiros (arredondado ao
+        # microssegundo e truncado ao centésimo, como fazia o datetime + timedelta)
+        centiseconds = round(current_frame / img_fps * 1_000_000) // 10_000
+        sec, ms = divmod(centiseconds, 100)
+        min, sec = divmod(sec, 60)
+        hr, min = divmod(min, 60)
         return f"{hr}:{min:02d}:{sec:02d}.{ms:02d}"
     except Exception as e:
         logger.error(f"Error calculating timestamp: {e}", exc_info=True)
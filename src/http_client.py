@@ -0,0 +1,26 @@
+"""
+http_client module holds the HTTP client shared by every download from GitHub.
+
+Frames and subtitles come from the same raw.githubusercontent.com host, so sharing
+one keep-alive pool (over HTTP/2) lets consecutive downloads reuse the TLS session
+instead of paying a new handshake each. Import this client instead of creating
+new ones, and don't close it: it is closed at exit.
+"""
+
+# Standard library imports
+import atexit
+
+# Third party imports
+import httpx
+
+# Initialize the HTTP client with a timeout and headers
+# The timeout is set to 30 seconds for the entire request and 10 seconds for the connection
+client = httpx.Client(
+    http2=True,
+    timeout=httpx.Timeout(30, connect=10),
+    limits=httpx.Limits(max_keepalive_connections=20, max_connections=40, keepalive_expiry=60),
+    headers={
+        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64)'
+        'AppleWebKit/537.36 (KHTML, like Gecko) Chrome/135.0.0.0 Safari/537.36'})
+
+atexit.register(client.close)
@@ -1,28 +1,136 @@
+from dataclasses import dataclass
 from pathlib import Path
 
-from ruamel.yaml import YAML
+import yaml
+
+# libyaml's C loader when PyYAML was built with it, the pure Python one otherwise
+try:
+    from yaml import CSafeLoader as Loader
+except ImportError:
+    from yaml import SafeLoader as Loader
 
 from src.logger import get_logger
-yaml: YAML = YAML()  # Criando a instância primeiro
-yaml.preserve_quotes = True  # Configurando preserve_quotes separadamente
-yaml.indent(mapping=2, sequence=4, offset=2)  # Corrigindo a indentação corretamente
-yaml.default_flow_style = False
 
 
 logger = get_logger(__name__)
 CONFIGS_PATH = Path.cwd() / "configs.yml"
 
 
-def load_configs() -> dict:
+@dataclass(frozen=True, slots=True)
+class EpisodeMeta:
+    """Settings of one episode, as declared under "episodes" in configs.yml."""
+    img_fps: int | float
+    number_of_frames: int
+    branch: str | None = None
+    frames_dir: int | None = None
+
+
+class Configs(dict):
+    """
+    The parsed configs.yml. load_configs() also builds, once, what the hot paths
+    read from it, instead of walking the nested dicts for every frame.
+    """
+    __slots__ = ("episodes", "frame_url_templates", "filter_weights")
+
+    def __init__(self, data: dict):
+        super().__init__(data)
+        self.episodes = build_episodes(self)
+        self.frame_url_templates = build_frame_url_templates(self)
+        self.filter_weights = build_filter_weights(self)
+
+
+# configs already loaded by this process, with the (st_mtime_ns, st_size) they were parsed from;
+# every module calling load_configs() gets the same object while configs.yml is unchanged
+loaded_configs: tuple[tuple[int, int], Configs] | None = None
+
+
+def _normalize(configs: dict) -> dict:
+    """
+    PyYAML follows YAML 1.1, where numbers with a leading zero that aren't valid
+    octal (e.g. frames_dir: 08, 09) load as strings; turn those back into ints.
+    """
+    for data in (configs or {}).get("episodes", {}).values():
+        frames_dir = data.get("frames_dir") if isinstance(data, dict) else None
+        if isinstance(frames_dir, str) and frames_dir.isdigit():
+            data["frames_dir"] = int(frames_dir)
+    return configs
+
+
+def load_configs() -> Configs | dict:
+    global loaded_configs
     if not CONFIGS_PATH.exists():
         logger.error(f"Config file not found: {CONFIGS_PATH}", exc_info=True)
         return {}
 
+    stat = CONFIGS_PATH.stat()
+    cache_key = (stat.st_mtime_ns, stat.st_size)
+    if loaded_configs is not None and loaded_configs[0] == cache_key:
+        return loaded_configs[1]
+
     try:
-        with open(CONFIGS_PATH, "r") as file:
-            return yaml.load(file)
+        with open(CONFIGS_PATH, "rb") as file:
+            configs = Configs(_normalize(yaml.load(file, Loader=Loader)) or {})
     except Exception as e:
         logger.error(f"Error while loading configs: {e}", exc_info=True)
         return {}
 
+    loaded_configs = (cache_key, configs)
+    return configs
+
+
+def build_episodes(configs: dict) -> dict[int, EpisodeMeta]:
+    """Metadata of every episode as {episode_number: EpisodeMeta}."""
+    return {
+        int(episode): EpisodeMeta(
+            img_fps=data.get("img_fps"),
+            number_of_frames=data.get("number_of_frames", 0),
+            branch=data.get("branch"),
+            frames_dir=data.get("frames_dir"),
+        )
+        for episode, data in configs.get("episodes", {}).items()
+    }
+
+
+def build_frame_url_templates(configs: dict) -> dict[int, str]:
+    """
+    The GitHub raw url of each episode's frames, with {frame} left to fill in.
+    Episodes missing github/branch/frames_dir values are left out.
+    """
+    username = configs.get("github", {}).get("username")
+    repo = configs.get("github", {}).get("repo")
+    templates = {}
+    for episode, data in build_episodes(configs).items():
+        if all([username, repo, data.branch, data.frames_dir]):
+            templates[episode] = (
+                f'https://raw.githubusercontent.com/{username}/{repo}/{data.branch}/{int(data.frames_dir):02d}/{{frame:04d}}.jpg'
+            )
+    return templates
+
+
+def build_filter_weights(configs: dict) -> tuple[list[str], list[float]]:
+    """The enabled filter names and their cumulative weights, for random.choices."""
+    names, cum_weights, total = [], [], 0
+    for filter_name, filter_settings in configs.get("filters", {}).items():
+        if isinstance(filter_settings, dict) and filter_settings.get("enabled", False):
+            total += filter_settings.get("percent", 0)
+            names.append(filter_name)
+            cum_weights.append(total)
+    return names, cum_weights
+
+
+# The accessors below return what load_configs() built. Any other dict (e.g. {} when
+# configs.yml is missing) is read directly on every call, so it is never stale.
+
+def get_episodes(configs: dict) -> dict[int, EpisodeMeta]:
+    """Return the metadata of every episode as {episode_number: EpisodeMeta}."""
+    return configs.episodes if isinstance(configs, Configs) else build_episodes(configs)
+
+
+def frame_url_templates(configs: dict) -> dict[int, str]:
+    """Return the GitHub raw url template of each episode's frames."""
+    return configs.frame_url_templates if isinstance(configs, Configs) else build_frame_url_templates(configs)
+
 
+def filter_weights(configs: dict) -> tuple[list[str], list[float]]:
+    """Return the enabled filter names and their cumulative weights."""
+    return configs.filter_weights if isinstance(configs, Configs) else build_filter_weights(configs)
@@ -1,5 +1,10 @@
+import atexit
 import logging
+from logging.handlers import MemoryHandler, QueueHandler, QueueListener
+import multiprocessing
 from pathlib import Path
+import queue
+import sys
 
 # Configuração do logger
 LOG_DIR = Path.cwd() / "logs"
@@ -7,14 +12,57 @@ LOG_DIR.mkdir(exist_ok=True)
 
 LOG_FILE = LOG_DIR / "app.log"
 
+# app.log and stderr only receive errors, written by a background thread so
+# logging an error is a queue.put instead of a disk write and a stderr flush
+file_handler = logging.FileHandler(LOG_FILE, encoding="utf-8", delay=True) # opened on the first error
+file_handler.setLevel(logging.ERROR)
+error_handler = logging.StreamHandler()
+error_handler.setLevel(logging.ERROR)
+
+# the filter worker processes exit without running atexit, so nothing is queued or
+# buffered there: their (rare) log records are written directly
+IS_WORKER = multiprocessing.parent_process() is not None
+
+if IS_WORKER:
+    error_handlers = [file_handler, error_handler]
+else:
+    log_queue = queue.Queue(-1)
+    error_listener = QueueListener(log_queue, file_handler, error_handler, respect_handler_level=True)
+    error_listener.start()
+    atexit.register(error_listener.stop) # writes what is still queued
+
+    # the QueueHandler formats the record (message, traceback) before it is queued
+    queue_handler = QueueHandler(log_queue)
+    queue_handler.setLevel(logging.ERROR) # progress messages propagate here too, don't queue them
+    error_handlers = [queue_handler]
+
 logging.basicConfig(
     level=logging.ERROR,
     format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
-    handlers=[
-        logging.FileHandler(LOG_FILE, encoding="utf-8"),
-        logging.StreamHandler()
-    ]
+    handlers=error_handlers
 )
 
+# Progress messages (info/warning) go to stdout, buffered so each line doesn't
+# cost a write on the hot path. The buffer is flushed when it is full, on a
+# warning, by flush_logs() and at exit.
+progress_stream = logging.StreamHandler(sys.stdout)
+progress_stream.setFormatter(logging.Formatter("%(message)s"))
+if IS_WORKER:
+    progress_handler = progress_stream
+else:
+    progress_handler = MemoryHandler(capacity=64, flushLevel=logging.WARNING, target=progress_stream)
+progress_handler.addFilter(lambda record: record.levelno < logging.ERROR)
+
+# only our own loggers, third party ones (e.g. httpx logs request urls with the token) stay at ERROR
+for name in ("__main__", "src"):
+    logging.getLogger(name).setLevel(logging.INFO)
+    logging.getLogger(name).addHandler(progress_handler)
+
+
 def get_logger(name: str) -> logging.Logger:
-    return logging.getLogger(name)
\ No newline at end of file
+    return logging.getLogger(name)
+
+
+def flush_logs() -> None:
+    """Write the buffered progress messages, e.g. before a long sleep."""
+    progress_handler.flush()
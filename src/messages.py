@@ -0,0 +1,25 @@
+"""
+messages module fills the post message templates defined in the configs.
+"""
+
+# Standard library imports
+from functools import lru_cache
+from string import Formatter
+
+
+@lru_cache(maxsize=8)
+def template_fields(template: str) -> frozenset[str]:
+    """
+    Return the names of the fields used by a message template.
+    Templates don't change during a run, so each one is parsed only once.
+    """
+    return frozenset(field for _, field, _, _ in Formatter().parse(template) if field)
+
+
+def format_message(template: str, values: dict) -> str:
+    """
+    Fill a message template using only the values it references.
+    Raises KeyError if the template uses a field that is not in values.
+    """
+    fields = template_fields(template)
+    return template.format_map({key: values[key] for key in fields if key in values})
@@ -0,0 +1,353 @@
+"""
+pipeline module holds the posting flow of the bot.
+
+It prepares random frames (download, subtitles, filters, random crop) and
+posts them to Facebook, one every posting interval.
+"""
+
+# Standard library imports
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from multiprocessing import get_context
+from pathlib import Path
+import random
+from time import monotonic, sleep
+from typing import Optional
+
+# Local imports
+from src.filters import select_filter, apply_filter, none_filter
+from src.facebook import get_api
+from src.logger import flush_logs, get_logger
+from src.frames_util import (
+    download_frame,
+    frame_to_timestamp,
+    get_random_frame,
+    random_crop,
+    save_posted_frame
+)
+from src.load_configs import get_episodes, load_configs
+from src.messages import format_message
+from src.poster import post_frame, post_random_crop, post_subtitles, post_subtitles_batch
+from src.subtitle import (
+    download_subtitles_if_needed,
+    get_subtitle_message,
+    prefetch_subtitles
+)
+from src.request_by import main_request_by_process
+
+logger = get_logger(__name__)
+
+MAX_RETRY_DELAY = 60 # seconds, upper bound of the error backoff
+WARMUP_LEAD = 5 # seconds before the next post to reopen the Graph API connection
+PREPARE_WORKERS = 4 # frames prepared in parallel, kept low to stay under GitHub's raw rate limit
+
+
+
+
+# agrupa as funcoes de postagem
+def post_frame_data(season, frame_data: dict, configs: dict) -> Optional[str]:
+    """
+    Posta um frame com base em seus dados.
+
+    Args:
+        season (str): A temporada do anime em que o frame se encontra.
+        frame_data (dict or list): Um dicionário contendo as informações do frame que será postado.
+            Caso seja um dicionário, as chaves devem ser "episode", "path" e "timestamp".
+            Caso seja uma lista, é esperado que contenha dois dicionários com as mesmas chaves,
+            representando dois frames que serão postados lado a lado.
+        configs (dict): O dicionário de configurações.
+
+    Returns:
+        str: O ID do post criado, ou None se falhar.
+    """
+    episodes = get_episodes(configs)
+
+
+    if isinstance(frame_data, list) and len(frame_data) == 2: # frame pode ser um uma lista ou um dicionário por isso essa checagem
+        message: str = configs.get("msg_two_panels")
+        if not message:
+            logger.error("✖ Failed to get message template from configs")
+            return None
+            
+        try:
+            # Create a dictionary with all possible values
+            format_dict = {
+                "season": season,
+                "episode1": frame_data[0].get("episode"),
+                "total_frames_in_this_episode1": episodes[frame_data[0].get("episode")].number_of_frames,
+                "episode2": frame_data[1].get("episode"),
+                "total_frames_in_this_episode2": episodes[frame_data[1].get("episode")].number_of_frames,
+                "frame1": frame_data[0].get("frame"),
+                "frame2": frame_data[1].get("frame"),
+                "timestamp1": frame_data[0].get("timestamp"),
+                "timestamp2": frame_data[1].get("timestamp"),
+                "filter_func": frame_data[0].get("filter_func")
+            }
+            
+            message = format_message(message, format_dict)
+        except KeyError as e:
+            logger.error(f"✖ Missing required field in frame_data: {e}")
+            return None
+        except Exception as e:
+            logger.error(f"✖ Error formatting message: {e}")
+            return None
+
+        logger.info(
+            "\n\n"
+            f'├── Posting two panels, Episodes: ( {frame_data[0].get("episode")}, {frame_data[1].get("episode")} ) '
+            f'Frames: ( {frame_data[0].get("frame")}, {frame_data[1].get("frame")} ) '
+            f'out of ( {episodes[frame_data[0].get("episode")].number_of_frames}, {episodes[frame_data[1].get("episode")].number_of_frames} )'
+        )
+
+        post_id = post_frame(message, frame_data[0].get('output'))
+        if not post_id:
+            logger.error("✖ Failed to post frame data (main)")
+            return None
+        
+        post_subtitles_batch(post_id, frame_data, configs) # both subtitles in a single request
+        post_random_crop(post_id, frame_data[0].get('output'), configs, frame_data[0].get('crop'))
+        return post_id
+
+    else:
+        message: str = configs.get("msg_single_frame")
+        if not message:
+            logger.error("✖ Failed to get message template from configs")
+            return None
+            
+        try:
+            # Create a dictionary with all possible values
+            format_dict = {
+                "season": season,
+                "episode": frame_data.get("episode"),
+                "total_frames_in_this_episode": episodes[frame_data.get("episode")].number_of_frames,
+                "frame": frame_data.get("frame"),
+                "timestamp": frame_data.get("timestamp"),
+                "filter_func": frame_data.get("filter_func")
+            }
+            
+            message = format_message(message, format_dict)
+        except KeyError as e:
+            logger.error(f"✖ Missing required field in frame_data: {e}")
+            return None
+        except Exception as e:
+            logger.error(f"✖ Error formatting message: {e}")
+            return None
+
+        logger.info(
+            "\n\n"
+            f"├── Posting {frame_data.get('filter_func')}, Episode: {frame_data.get('episode')} "
+            f"Frame: {frame_data.get('frame')} "
+            f"out of {episodes[frame_data.get('episode')].number_of_frames}"
+        )
+
+        post_id = post_frame(message, frame_data.get('output'))
+        if not post_id:
+            logger.error("✖ Failed to post frame data")
+            return None
+        
+        post_subtitles(post_id, frame_data.get('frame'), frame_data.get('episode'), frame_data.get('subtitle'), configs)
+        post_random_crop(post_id, frame_data.get('output'), configs, frame_data.get('crop'))
+        return post_id
+
+def process_frame(CONFIGS, filter_func) -> Optional[dict]:
+    """
+    Process a random frame and apply the selected filter.
+    Returns a dictionary with frame data.
+    """
+
+    frame_number, episode_number = get_random_frame(CONFIGS)
+    if not episode_number or not frame_number:
+        logger.error("Error: No valid frame found.")
+        return None
+
+    frame = download_frame(CONFIGS, frame_number, episode_number)
+    if not frame:
+        logger.error(f"Error: Frame {frame_number} from episode {episode_number} not found.")
+        return None
+    frame_path, frame_bytes = frame
+
+    download_subtitles_if_needed(episode_number, CONFIGS)
+    subtitle = get_subtitle_message(frame_number, episode_number, CONFIGS)
+    timestamp = frame_to_timestamp(get_episodes(CONFIGS)[episode_number].img_fps, frame_number)
+
+    return {
+        "frame_path": frame_path,
+        "frame_bytes": frame_bytes,
+        "episode": episode_number,
+        "frame": frame_number,
+        "subtitle": subtitle,
+        "timestamp": timestamp,
+        "filter_func": filter_func.__name__
+    }
+
+def process_two_panels(CONFIGS, filter_func) -> list[dict]:
+    """
+    Process the two frames of a two_panels post concurrently.
+    Results keep submission order; if either frame fails, the post is dropped (empty list).
+    """
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        framedata = list(executor.map(lambda _: process_frame(CONFIGS, filter_func), range(2)))
+
+    if not all(framedata):
+        return []
+    return framedata
+
+
+def backoff(retry_delay: int) -> int:
+    """
+    Sleep for retry_delay seconds plus a random jitter after an error.
+    Returns the delay for the next consecutive error, doubled up to MAX_RETRY_DELAY.
+    """
+    sleep(min(retry_delay + random.random(), MAX_RETRY_DELAY))
+    return min(retry_delay * 2, MAX_RETRY_DELAY)
+
+
+def prepare_random_crop(output: Path | bytes, configs: dict) -> Optional[tuple[bytes, str]]:
+    """
+    Crop the frame while it is being prepared, so the decode/crop/encode work
+    stays off the posting path. Returns None if random crop is disabled or fails.
+    """
+    if not configs.get("posting", {}).get("random_crop", {}).get("enabled", False):
+        return None
+
+    crop, crop_message = random_crop(output, configs)
+    if not crop or not crop_message:
+        return None
+    return crop, crop_message
+
+
+def run_filter(filter_func, framedata: list[dict], filter_pool: Optional[Executor] = None) -> Optional[Path | bytes]:
+    """
+    Apply the filter in filter_pool when one is given, so the image work
+    runs in another process and doesn't hold this process' GIL.
+    none_filter has no image work: the downloaded bytes are uploaded as they are.
+    """
+    if filter_func is none_filter and framedata[0].get("frame_bytes"):
+        return framedata[0]["frame_bytes"]
+
+    if filter_pool is None or filter_func is none_filter:
+        return apply_filter(filter_func, framedata)
+    # the filters read the frames from disk, no need to send the downloaded bytes to the pool
+    paths = [{"frame_path": data["frame_path"]} for data in framedata]
+    return filter_pool.submit(apply_filter, filter_func, paths).result()
+
+
+def prepare_frame_data(configs: dict, filter_func, filter_pool: Optional[Executor] = None) -> Optional[dict | list[dict]]:
+    """
+    Process the frame(s) for filter_func and apply the filter (in filter_pool, if given).
+    Returns the frame data ready for post_frame_data, or None if any step fails.
+    """
+    if not filter_func:
+        logger.error(f"✖ No filter selected or filter is not callable")
+        return None
+
+    if filter_func.__name__ == 'two_panels':
+        framedata = process_two_panels(configs, filter_func)
+        if not framedata:
+            logger.error(f"✖ Error processing frames for two_panels")
+            return None
+
+        output = run_filter(filter_func, framedata, filter_pool)
+        if not output:
+            logger.error(f"✖ Error generating output for two_panels")
+            return None
+
+        framedata[0]['output'] = output
+        framedata[0]['crop'] = prepare_random_crop(output, configs)
+        return framedata
+
+    data = process_frame(configs, filter_func)
+    if not data:
+        logger.error(f"✖ Error processing frame")
+        return None
+
+    output = run_filter(filter_func, [data], filter_pool)
+    if not output:
+        logger.error(f"✖ Error generating output for single frame")
+        return None
+
+    data['output'] = output
+    data['crop'] = prepare_random_crop(output, configs)
+    return data
+
+
+def try_prepare_frame_data(configs: dict, filter_func, filter_pool: Optional[Executor] = None) -> Optional[dict | list[dict]]:
+    """prepare_frame_data for the prepare pool: errors are logged and the frame is skipped."""
+    try:
+        return prepare_frame_data(configs, filter_func, filter_pool)
+    except (IndexError, KeyError, Exception) as e:
+        logger.error(f"✖ Error processing frame: {str(e)}")
+        return None
+
+
+def main():
+    """
+    Main function of the program. It posts frames from anime to Facebook pages.
+    
+    The function reads the configuration file, selects a random frame from the episodes,
+    applies a random filter to the frame, and posts the frame to the specified Facebook
+    pages. The function also handles posting subtitles and random crops of the frame.
+
+    The function repeats the process indefinitely, with a configurable posting interval.
+    """
+
+    fb = get_api() # fails fast without FB_TOKEN, before any frame is prepared
+    configs = load_configs()
+    prefetch_subtitles(configs) # runs in the background while the recommendations are processed
+
+    main_request_by_process() # request by process (post frames by recommendations of users)
+
+    logger.info('\n' + '-' * 50 + '\n' + '-' * 50) # makes visualization better in CI/CD environments
+
+    season = int(configs.get("season", 0))
+    posting_interval = configs.get("posting", {}).get("posting_interval", 2)
+    fph = configs.get("posting", {}).get("fph", 15)
+
+    # every filter is picked upfront, then all frames are prepared in parallel
+    # (filters applied in worker processes) and posted in order as soon as each one is ready
+    filters = [select_filter(configs) for _ in range(fph)]
+    filter_pool = ProcessPoolExecutor(max_workers=2, mp_context=get_context("spawn"))
+    prepare_pool = ThreadPoolExecutor(max_workers=PREPARE_WORKERS)
+    prepared_frames = prepare_pool.map(
+        lambda filter_func: try_prepare_frame_data(configs, filter_func, filter_pool), filters
+    )
+
+    try:
+        retry_delay = 1
+        for _ in range(1, fph + 1):
+            loop_start = monotonic()
+            frame_data = next(prepared_frames)
+            if not frame_data:
+                # its download and filter jobs already ran in the prepare pool, waiting here
+                # would only delay the frames after it; the error was logged by try_prepare_frame_data
+                continue
+
+            try:
+                post_id = post_frame_data(season, frame_data, configs)
+            except Exception as e:
+                logger.error(f"✖ Error posting frame: {str(e)}")
+                post_id = None
+
+            # post_frame_data logs its own errors and returns None
+            if not post_id:
+                retry_delay = backoff(retry_delay)
+                continue
+
+            retry_delay = 1 # only reset by a post that went through
+
+            # the frames are only saved to the history once posted, not when they were picked
+            for posted in (frame_data if isinstance(frame_data, list) else [frame_data]):
+                save_posted_frame(posted["frame"], posted["episode"])
+
+            logger.info('\n' + '-' * 50 + '\n' + '-' * 50) # makes visualization better in CI/CD environments
+            flush_logs() # nothing else happens on the posting side until the next post
+            # sleep until the next slot, time spent waiting for the frame and posting included.
+            # Idle connections expire during the interval, so it is reopened just before the next post
+            remaining = posting_interval * 60 - (monotonic() - loop_start)
+            if remaining > WARMUP_LEAD:
+                sleep(remaining - WARMUP_LEAD)
+                fb.warmup()
+            sleep(max(0, posting_interval * 60 - (monotonic() - loop_start)))
+    finally:
+        # also on an error: frames not started yet are dropped instead of prepared for nothing
+        prepare_pool.shutdown(cancel_futures=True)
+        filter_pool.shutdown(cancel_futures=True)
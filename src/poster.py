@@ -7,26 +7,23 @@ to Facebook pages in an organized way.
 
 # Standard library imports
 from pathlib import Path
-from time import sleep
 from typing import Optional
 
 # Third party imports
-from src.facebook import FacebookAPI
+from src.facebook import get_api
 from src.logger import get_logger
 from src.frames_util import random_crop
 
 # Initialize services
-fb = FacebookAPI()
 logger = get_logger(__name__)
 
 # post frame
-def post_frame(message: str, frame_path: Path) -> Optional[str]:
-    """Post a frame and return the post ID."""
+def post_frame(message: str, frame: Path | bytes) -> Optional[str]:
+    """Post a frame (a path, or the JPEG bytes built by a filter) and return the post ID."""
     try:
-        post_id = fb.post(message, frame_path)
+        post_id = get_api().post(message, frame)
         if post_id:
-            print("├── Frame has been posted", flush=True)
-            sleep(2)
+            logger.info("├── Frame has been posted")
         else:
             logger.error("✖ Failed to post frame (main, post_frame)")
         return post_id
@@ -34,6 +31,12 @@ def post_frame(message: str, frame_path: Path) -> Optional[str]:
         logger.error(f"✖ Error posting frame: {e}")
         return None
     
+def subtitle_message(frame_number: int, episode: int, subtitle: str, configs: dict) -> str:
+    """Build the comment message for the subtitles of a frame."""
+    if configs.get("filters", {}).get("two_panels", {}).get("enabled", False):
+        return f"Episode {episode} Frame {frame_number}\n\n{subtitle}"
+    return subtitle
+
 def post_subtitles(post_id: str, frame_number: int, episode: int, subtitle: str, configs: dict) -> Optional[str]:
     """Post the subtitles associated with the frame."""
     if not configs.get("posting", {}).get("posting_subtitles", False):
@@ -42,16 +45,12 @@ def post_subtitles(post_id: str, frame_number: int, episode: int, subtitle: str,
     if not subtitle:
         return None
 
-    if configs.get("filters", {}).get("two_panels", {}).get("enabled", False):
-        message = f"Episode {episode} Frame {frame_number}\n\n{subtitle}"
-    else:
-        message = subtitle
+    message = subtitle_message(frame_number, episode, subtitle, configs)
 
     try:
-        subtitle_post_id = fb.post(message, None, post_id)
+        subtitle_post_id = get_api().post(message, None, post_id)
         if subtitle_post_id:
-            print("└── Subtitle has been posted", flush=True)
-            sleep(2)
+            logger.info("└── Subtitle has been posted")
         else:
             logger.error("✖ Failed to post subtitle (main, post_subtitles)")
         return subtitle_post_id
@@ -60,18 +59,51 @@ def post_subtitles(post_id: str, frame_number: int, episode: int, subtitle: str,
         return None
 
 
-def post_random_crop(post_id: str, frame_path: Path, configs: dict) -> Optional[str]:
-    """Post a random cropped frame."""
+def post_subtitles_batch(post_id: str, frames_data: list[dict], configs: dict) -> list[Optional[str]]:
+    """
+    Post the subtitles of several frames (e.g. both two_panels frames)
+    as comments in a single Graph API batch request.
+    """
+    if not configs.get("posting", {}).get("posting_subtitles", False):
+        return []
+
+    requests = [
+        get_api().comment_request(
+            post_id,
+            subtitle_message(data.get("frame"), data.get("episode"), data.get("subtitle"), configs)
+        )
+        for data in frames_data if data.get("subtitle")
+    ]
+    if not requests:
+        return []
+
+    try:
+        subtitle_post_ids = get_api().post_batch(requests)
+        for subtitle_post_id in subtitle_post_ids:
+            if subtitle_post_id:
+                logger.info("└── Subtitle has been posted")
+            else:
+                logger.error("✖ Failed to post subtitle (main, post_subtitles_batch)")
+        return subtitle_post_ids
+    except Exception as e:
+        logger.error(f"✖ Error posting subtitles batch: {e}")
+        return [None] * len(requests)
+
+
+def post_random_crop(post_id: str, frame_path: Path | bytes, configs: dict, crop: Optional[tuple[bytes, str]] = None) -> Optional[str]:
+    """
+    Post a random cropped frame.
+    If crop (the result of random_crop) was prepared in advance, it is posted as is.
+    """
     if not configs.get("posting", {}).get("random_crop", {}).get("enabled", False):
         return None
 
     try:
-        crop_path, crop_message = random_crop(frame_path, configs)
-        if crop_path and crop_message:
-            crop_post_id = fb.post(crop_message, crop_path, post_id)
+        crop_bytes, crop_message = crop or random_crop(frame_path, configs)
+        if crop_bytes and crop_message:
+            crop_post_id = get_api().post(crop_message, crop_bytes, post_id)
             if crop_post_id:
-                print("└── Random Crop has been posted", flush=True)
-                sleep(2)
+                logger.info("└── Random Crop has been posted")
             else:
                 logger.error("✖ Failed to post random crop (main, post_random_crop)")
             return crop_post_id
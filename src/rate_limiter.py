@@ -0,0 +1,89 @@
+"""
+rate_limiter module throttles posting based on the usage reported by the Graph API.
+
+Facebook returns the current quota usage (in percent) on every response through the
+X-App-Usage, X-Page-Usage and X-Business-Use-Case-Usage headers. Instead of sleeping a
+fixed time after each post, the limiter keeps a minimum spacing between requests and only
+waits longer when that usage gets close to the limit.
+"""
+
+# Standard library imports
+import json
+import threading
+import time
+
+# Third party imports
+from src.logger import get_logger
+
+logger = get_logger(__name__)
+
+USAGE_HEADERS = ("x-app-usage", "x-page-usage", "x-business-use-case-usage")
+USAGE_KEYS = ("call_count", "total_cputime", "total_time")
+
+
+class RateLimiter:
+    """
+    Token bucket driven by the usage Facebook reports back.
+    Requests are spaced at least min_interval apart (against time.monotonic, so
+    time spent on other work between posts counts towards it). Above the usage
+    threshold, wait() also backs off exponentially until the usage drops again.
+    """
+
+    def __init__(self, threshold: float = 75.0, base_delay: float = 2.0, max_delay: float = 60.0, min_interval: float = 2.0):
+        self.threshold = threshold
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.min_interval = min_interval
+        self._usage = 0.0
+        self._delay = base_delay
+        self._next_slot = 0.0
+        self._lock = threading.Lock()
+
+    def update(self, headers) -> None:
+        """Record the highest usage percentage found in the response headers."""
+        usage = 0.0
+        for header in USAGE_HEADERS:
+            raw = headers.get(header)
+            if not raw:
+                continue
+            try:
+                usage = max(usage, self._parse_usage(json.loads(raw)))
+            except (ValueError, TypeError):
+                logger.warning(f"Could not parse {header} header: {raw}")
+
+        with self._lock:
+            self._usage = usage
+
+    def _parse_usage(self, data) -> float:
+        """
+        X-App-Usage/X-Page-Usage are a flat dict of percentages, while
+        X-Business-Use-Case-Usage maps business ids to lists of those dicts.
+        """
+        if isinstance(data, list):
+            return max((self._parse_usage(item) for item in data), default=0.0)
+
+        if isinstance(data, dict):
+            if any(key in data for key in USAGE_KEYS):
+                return float(max(data.get(key, 0) for key in USAGE_KEYS))
+            return max((self._parse_usage(item) for item in data.values()), default=0.0)
+
+        return 0.0
+
+    def wait(self) -> None:
+        """Block until the next request slot, longer while the reported usage is above the threshold."""
+        with self._lock:
+            now = time.monotonic()
+            delay = max(0.0, self._next_slot - now)
+            usage = self._usage
+
+            if usage < self.threshold:
+                self._delay = self.base_delay
+            else:
+                delay = max(delay, min(self._delay * usage / 100, self.max_delay))
+                self._delay = min(self._delay * 2, self.max_delay)
+                logger.warning(f"Graph API usage at {usage:.0f}%, waiting {delay:.1f}s before the next post")
+
+            self._next_slot = now + delay + self.min_interval
+
+        if delay:
+            time.sleep(delay)
@@ -1,3 +1,5 @@
+import atexit
+import copy
 import json
 from pathlib import Path
 from typing import List, Dict
@@ -17,23 +19,34 @@ if not RECOMMENDATIONS_PATH.exists():
     with open(RECOMMENDATIONS_PATH, 'w', encoding='utf-8') as file:
         json.dump(DEFAULT_STRUCTURE, file, indent=2, ensure_ascii=False)
 
+# the file is read once per process, the functions below change this dict
+# and flush_recommendations writes it back only if something changed
+_state: Dict | None = None
+_dirty = False
+
 def load_recommendations() -> Dict:
     """
     Load recommendations from JSON file.
+    Only the first call reads the file, later calls return the same dict.
     
     Returns:
         Dict: Dictionary containing processing state and recommendations list.
         Returns default structure if file not found.
     """
+    global _state
+    if _state is not None:
+        return _state
+
     try:
         with open(RECOMMENDATIONS_PATH, 'r', encoding='utf-8') as file:
-            return json.load(file)
+            _state = json.load(file)
     except FileNotFoundError:
         logger.warning(f"Recommendations file not found at {RECOMMENDATIONS_PATH}")
-        return DEFAULT_STRUCTURE.copy()
+        _state = copy.deepcopy(DEFAULT_STRUCTURE)
     except json.JSONDecodeError:
         logger.error(f"Invalid JSON in recommendations file at{RECOMMENDATIONS_PATH}")
-        return DEFAULT_STRUCTURE.copy()
+        _state = copy.deepcopy(DEFAULT_STRUCTURE)
+    return _state
 
 def save_recommendations(data: Dict) -> None:
     """
@@ -48,9 +61,26 @@ def save_recommendations(data: Dict) -> None:
     except Exception as e:
         logger.error(f"Error saving recommendations: {e}")
 
+def _mark_dirty() -> None:
+    global _dirty
+    _dirty = True
+
+def flush_recommendations() -> None:
+    """
+    Write the recommendations in memory to the JSON file, if they changed since the last flush.
+    Also registered with atexit, so changes are not lost if the run stops early.
+    """
+    global _dirty
+    if _state is None or not _dirty:
+        return
+    save_recommendations(_state)
+    _dirty = False
+
+atexit.register(flush_recommendations)
+
 def add_recommendations(new_recommendations: List[Dict]) -> None:
     """
-    Add new recommendations to the JSON file.
+    Add new recommendations to the recommendations in memory.
     
     Args:
         new_recommendations (List[Dict]): List of new recommendations to add
@@ -59,16 +89,15 @@ def add_recommendations(new_recommendations: List[Dict]) -> None:
         return
     
     data = load_recommendations()
+    # (episode, frame) of the stored recommendations, to check duplicates in O(1)
+    existing = {(rec["episode"], rec["frame"]) for rec in data["recommendations"]}
     for new_recommendation in new_recommendations:
-        is_duplicate = any(
-            rec["episode"] == new_recommendation["episode"] and 
-            rec["frame"] == new_recommendation["frame"] 
-            for rec in data["recommendations"]
-        )
-        if not is_duplicate:
+        key = (new_recommendation["episode"], new_recommendation["frame"])
+        if key not in existing:
             data["recommendations"].append(new_recommendation)
+            existing.add(key)
 
-    save_recommendations(data)
+    _mark_dirty()
 
 def clear_recommendations(max_recommendations: int = 100) -> None:
     """
@@ -77,7 +106,7 @@ def clear_recommendations(max_recommendations: int = 100) -> None:
     data = load_recommendations()
     if len(data["recommendations"]) > max_recommendations:
         data["recommendations"] = data["recommendations"][-max_recommendations:]
-    save_recommendations(data)
+        _mark_dirty()
 
 # mudar de true para false para rodar o processamento
 def set_execute_state(value: bool) -> None:
@@ -89,7 +118,7 @@ def set_execute_state(value: bool) -> None:
     """
     data = load_recommendations()
     data["execute"] = value
-    save_recommendations(data)
+    _mark_dirty()
 
 def get_unseen_recommendations() -> List[Dict]:
     """
@@ -113,5 +142,5 @@ def mark_recommendation_as_seen(episode: int, frame: int) -> None:
     for rec in data["recommendations"]:
         if rec["episode"] == episode and rec["frame"] == frame:
             rec["seen"] = True
-            break
-    save_recommendations(data) 
\ No newline at end of file
+            _mark_dirty()
+            break 
\ No newline at end of file
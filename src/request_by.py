@@ -1,25 +1,29 @@
+from concurrent.futures import ThreadPoolExecutor
 from src.frames_util import download_frame, frame_to_timestamp
 from src.poster import post_frame, post_random_crop, post_subtitles
-from src.facebook import FacebookAPI
+from src.facebook import get_api
 from src.logger import get_logger
 from src.recommendations import (
     add_recommendations,
     load_recommendations,
     set_execute_state,
     get_unseen_recommendations,
-    mark_recommendation_as_seen
+    mark_recommendation_as_seen,
+    flush_recommendations
 )
-from src.load_configs import load_configs
+from src.load_configs import get_episodes, load_configs
+from src.messages import format_message
 from pathlib import Path
 from typing import Optional
 from src.subtitle import get_subtitle_message
 
 
-fb = FacebookAPI()
 CONFIGS = load_configs()
 
 logger = get_logger(__name__)
 
+DOWNLOAD_WORKERS = 4 # same bound as the posting pipeline, to stay under GitHub's raw rate limit
+
 
 
 def process_new_recommendations():
@@ -28,6 +32,7 @@ def process_new_recommendations():
     """
     try:
         # Busca e processa as recomendações
+        fb = get_api()
         posts = fb.get_posts()
         comments = fb.extract_comments(posts)
         new_recommendations = fb.parse_frame_recommendations(comments)
@@ -43,16 +48,18 @@ def process_recommendation(recommendation: dict):
     Process a recommendation.
     """
     frame_number, episode_number = recommendation.get("frame"), recommendation.get("episode")
-    frame_path = download_frame(CONFIGS, frame_number, episode_number)
-    if not frame_path:
+    frame = download_frame(CONFIGS, frame_number, episode_number)
+    if not frame:
         logger.error(f"Error: Frame {frame_number} from episode {episode_number} not found.")
         return None
+    frame_path, frame_bytes = frame
     
     subtitle = get_subtitle_message(frame_number, episode_number, CONFIGS)
-    timestamp = frame_to_timestamp(CONFIGS.get("episodes").get(episode_number).get("img_fps"), frame_number)
+    timestamp = frame_to_timestamp(get_episodes(CONFIGS)[episode_number].img_fps, frame_number)
 
     return {
         "frame_path": frame_path,
+        "frame_bytes": frame_bytes,
         "episode": episode_number,
         "frame": frame_number,
         "user_name": recommendation.get("user_name"),
@@ -62,6 +69,15 @@ def process_recommendation(recommendation: dict):
 
 
 
+def try_process_recommendation(recommendation: dict) -> Optional[dict]:
+    """process_recommendation for the download pool: errors are logged and the recommendation is skipped."""
+    try:
+        return process_recommendation(recommendation)
+    except Exception as e:
+        logger.error(f"✖ Error processing recommendation {recommendation}: {e}", exc_info=True)
+        return None
+
+
 def post_frame_by_recommendation(season: int, frame_data: dict, configs: dict) -> Optional[str]:
     """
     Post a frame by recommendation.
@@ -80,23 +96,19 @@ def post_frame_by_recommendation(season: int, frame_data: dict, configs: dict) -
             "user_name": frame_data.get("user_name"),
             "total_frames_in_this_episode": frame_data.get("total_frames_in_this_episode")
         }
-        required_keys = [key for key in format_dict.keys() if "{" + key + "}" in message]
-        present_keys = {k: format_dict[k] for k in required_keys}
-        message = message.format(**present_keys)
+        # the template's fields are parsed once per run, not for every recommendation
+        message = format_message(message, format_dict)
 
 
-        print(
+        logger.info(
             "\n\n"
-            "├── Posting frame by recommendation, Episode:",
-            f'( {frame_data.get("episode")} )',
-            "Frame:",
-            f'( {frame_data.get("frame")} )',
-            "User:",
-            f'( {frame_data.get("user_name")} )',
-            flush=True
+            f'├── Posting frame by recommendation, Episode: ( {frame_data.get("episode")} ) '
+            f'Frame: ( {frame_data.get("frame")} ) '
+            f'User: ( {frame_data.get("user_name")} )'
         )
 
-        post_id = post_frame(message, frame_data.get("frame_path"))
+        # uploaded straight from the downloaded bytes, the saved file is only read for the crop
+        post_id = post_frame(message, frame_data.get("frame_bytes") or frame_data.get("frame_path"))
         if not post_id:
             logger.error("Failed to post frame")
             return None
@@ -118,6 +130,12 @@ def post_frame_by_recommendation(season: int, frame_data: dict, configs: dict) -
         return None
 
 def main_request_by_process():
+    try:
+        _request_by_process()
+    finally:
+        flush_recommendations() # one write of recommendations.json per run
+
+def _request_by_process():
     process_new_recommendations()
     unseen_recommendations = get_unseen_recommendations()
 
@@ -132,15 +150,18 @@ def main_request_by_process():
         return
     
 
-    for unseen_recommendation in unseen_recommendations:
-        season = int(CONFIGS.get("season", 0))
-        frame_data = process_recommendation(unseen_recommendation)
+    season = int(CONFIGS.get("season", 0))
+    # the frames are downloaded in parallel, then posted one by one in order
+    with ThreadPoolExecutor(max_workers=DOWNLOAD_WORKERS) as executor:
+        frames_data = list(executor.map(try_process_recommendation, unseen_recommendations))
+
+    for frame_data in frames_data:
+        if not frame_data:
+            continue # already logged
+
         post_id = post_frame_by_recommendation(season, frame_data, CONFIGS)
         if not post_id:
             logger.error("Failed to post frame by recommendation")
-            continue
-        
-        mark_recommendation_as_seen(unseen_recommendation.get("episode"), unseen_recommendation.get("frame"))
 
     
 
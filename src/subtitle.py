@@ -1,26 +1,32 @@
-from datetime import datetime, timedelta
+from bisect import bisect_left, bisect_right
+from collections.abc import Sequence
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from functools import lru_cache
 from pathlib import Path
 import re
+import threading
 
 import httpx
 from langdetect import detect
-from tenacity import retry, stop_after_attempt, wait_fixed
+from tenacity import retry, retry_if_exception_type, stop_after_attempt, wait_fixed
 
+from src.http_client import client
+from src.load_configs import get_episodes
 from src.logger import get_logger
-from src.frames_util import timestamp_to_seconds, frame_to_timestamp
+from src.frames_util import timestamp_to_seconds
 
 logger = get_logger(__name__)
 
-client = httpx.Client(
-    timeout=httpx.Timeout(30, connect=10),
-    headers={
-        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64)'
-        'AppleWebKit/537.36 (KHTML, like Gecko) Chrome/135.0.0.0 Safari/537.36'})
+
+
+# one lock per episode around everything that may add or rename its subtitle files:
+# the download, and language_detect renaming a file that the other threads may be reading
+episode_locks: dict[int, threading.Lock] = {}
 
 
 # Download subtitles from GitHub if they don't exist locally
 # para bots que guardam os subs na pasta fb, do bot tipo (fearocanity / ebtrfio-template)
-@retry(stop=stop_after_attempt(3), wait=wait_fixed(2))
 def download_subtitles_if_needed(episode: int, configs: dict) -> None:
     """
     Download subtitles from GitHub if they don't exist locally.
@@ -32,41 +38,42 @@ def download_subtitles_if_needed(episode: int, configs: dict) -> None:
     Returns:
         None: This function does not return anything.
     """
-    subtitles_dir = Path.cwd() / "subtitles"
-    episode_folder_subtitles = subtitles_dir / f"{episode:02d}"
+    # the prefetch and the frame being processed may ask for the same episode at once
+    with episode_locks.setdefault(episode, threading.Lock()):
+        return _download_subtitles(episode, configs)
 
-    if not subtitles_dir.exists():
-        subtitles_dir.mkdir(parents=True, exist_ok=True)
 
-    if not episode_folder_subtitles.exists():
-        episode_folder_subtitles.mkdir(parents=True, exist_ok=True)
+def _download_subtitles(episode: int, configs: dict) -> None:
+    """Body of download_subtitles_if_needed, called with the episode lock held."""
+    episode_folder_subtitles = Path.cwd() / "subtitles" / f"{episode:02d}"
 
-    files = [f for f in episode_folder_subtitles.iterdir() if f.is_file() and f.suffix == ".ass"]
+    # usually already downloaded: a single stat, the listing is shared with get_subtitle_message
+    files = subtitle_files(episode_folder_subtitles)
 
     if not files:
+        episode_folder_subtitles.mkdir(parents=True, exist_ok=True)
         github_data = configs.get("github", {})
-        episode_data = configs.get("episodes", {}).get(episode, {})
+        episode_data = get_episodes(configs).get(episode)
 
-        if not all([github_data.get("username"), github_data.get("repo"), episode_data.get("branch")]):
+        if not all([github_data.get("username"), github_data.get("repo"), episode_data and episode_data.branch]):
             logger.error("Error: Missing required configuration values.", exc_info=True)
             return None
 
         subtitle_url = (
             f'https://raw.githubusercontent.com/'
             f'{github_data["username"]}/{github_data["repo"]}/'
-            f'{episode_data["branch"]}/fb/subtitle_en.ass'
+            f'{episode_data.branch}/fb/subtitle_en.ass'
         )
 
         try:
-            response = client.get(subtitle_url)
-            
+            subtitle_file = episode_folder_subtitles / 'subtitle_en.ass'
+            response = stream_subtitles(subtitle_url, subtitle_file)
+
             if not response.status_code == 200:
                 logger.error(f"HTTP error while downloading subtitles for episode {episode}: "
                             f"{response.status_code} - {response.text}", exc_info=True)
                 return None
 
-            subtitle_file = episode_folder_subtitles / 'subtitle_en.ass'
-            subtitle_file.write_bytes(response.content)
             return subtitle_file
         except httpx.RequestError as e:
             logger.error(f"Request error while downloading subtitles for episode {episode}: {e}", exc_info=True)
@@ -80,6 +87,47 @@ def download_subtitles_if_needed(episode: int, configs: dict) -> None:
     return None
 
 
+@retry(
+    stop=stop_after_attempt(3),
+    wait=wait_fixed(2),
+    retry=retry_if_exception_type((httpx.TransportError, httpx.HTTPStatusError)),
+    reraise=True
+)
+def stream_subtitles(subtitle_url: str, subtitle_file: Path) -> httpx.Response:
+    """
+    Download subtitle_url into subtitle_file and return the response.
+    Only transient errors are retried: network errors and 5xx responses (raised as
+    HTTPStatusError). Other responses, like a 404 for a missing file, are returned as is.
+    """
+    # written to disk as it arrives, the subtitles are only read back from the file
+    with client.stream("GET", subtitle_url) as response:
+        if not response.status_code == 200:
+            response.read()
+            if response.status_code >= 500:
+                response.raise_for_status()
+            return response
+
+        # .part until complete, an interrupted download must not look like a subtitle file
+        partial_file = subtitle_file.with_suffix(".ass.part")
+        with open(partial_file, "wb") as file:
+            for chunk in response.iter_bytes(chunk_size=65536):
+                file.write(chunk)
+    partial_file.replace(subtitle_file)
+    return response
+
+
+def prefetch_subtitles(configs: dict, max_workers: int = 8) -> None:
+    """
+    Download the subtitles of every configured episode in the background.
+    Does not wait for the downloads, so later calls to download_subtitles_if_needed
+    find the files already in place instead of fetching them on the posting path.
+    """
+    executor = ThreadPoolExecutor(max_workers=max_workers)
+    for episode in configs.get("episodes", {}):
+        executor.submit(download_subtitles_if_needed, int(episode), configs)
+    executor.shutdown(wait=False)
+
+
 LANGUAGE_CODES = {
     "en": "English",
     "pt": "Português",
@@ -103,20 +151,29 @@ LANGUAGE_CODES = {
 }
 
 
+# compiled once, they run for every dialogue line of every subtitle file
+# Ajusta a regex para capturar tags e comandos com mais robustez
+TAGS_RE = re.compile(r"\{\s*[^}]*\s*\}|\\N|\\[a-zA-Z]+\d*|\\c&H[0-9A-Fa-f]+&")
+SIGNS_RE = re.compile(r"^signs?", re.IGNORECASE)
+LYRICS_RE = re.compile(r"lyrics?|songs?", re.IGNORECASE)
+
+
 def remove_tags(message: str) -> str:
     """Remove ASS/SSA tags and control codes from a subtitle string."""
-    # Ajusta a regex para capturar tags e comandos com mais robustez
-    pattern = re.compile(r"\{\s*[^}]*\s*\}|\\N|\\[a-zA-Z]+\d*|\\c&H[0-9A-Fa-f]+&")
-    # Substitui as tags e comandos por espaços
-    message = pattern.sub(" ", message)
-    # Remove múltiplos espaços
-    return re.sub(r"\s+", " ", message).strip()
-
-def language_detect(file_path: Path, dialogues: list[str]) -> str:
+    # Substitui as tags e comandos por espaços, e remove múltiplos espaços
+    # (str.split() sem argumento já ignora espaços repetidos e nas pontas)
+    return " ".join(TAGS_RE.sub(" ", message).split())
+
+# langdetect result of each (file, st_mtime_ns) whose name has no language code
+detected_lang_codes: dict[tuple[Path, int], str] = {}
+
+def language_detect(file_path: Path, dialogues: Sequence[str]) -> str:
     """Detects the language based on the dialogue content
       and renames the file with the detected lang code if it's not already in the file name.
     """
-    if not file_path.exists():
+    try:
+        mtime_ns = file_path.stat().st_mtime_ns
+    except FileNotFoundError:
         logger.error(f"Error: File not found: {file_path}", exc_info=True)
         return "Unknown"
 
@@ -128,8 +185,12 @@ def language_detect(file_path: Path, dialogues: list[str]) -> str:
     if len(name_parts) > 1 and name_parts[-1] in LANGUAGE_CODES:
         return LANGUAGE_CODES.get(name_parts[-1], "Unknown")
 
-    # Detects the language of the extracted text
-    lang_code = detect(" ".join(dialogues))
+    # Detects the language of the extracted text, once per file: it is only renamed
+    # below if the code is known and the new name is free, otherwise it would run for every frame
+    lang_code = detected_lang_codes.get((file_path, mtime_ns))
+    if lang_code is None:
+        lang_code = detect(" ".join(dialogues))
+        detected_lang_codes[(file_path, mtime_ns)] = lang_code
     language = LANGUAGE_CODES.get(lang_code, "Unknown")
 
     if language == "Unknown":
@@ -151,86 +212,165 @@ def language_detect(file_path: Path, dialogues: list[str]) -> str:
         logger.error(f"Error renaming file subtitle: {e}", exc_info=True)
         return "Unknown"
 
-def subtitle_ass(subtitle_file: str, current_frame: int, current_episode: int, configs: dict) -> str | None:
+@dataclass(frozen=True, slots=True)
+class Cue:
+    """A Dialogue line of an .ass file: start/end in seconds and the text as it is posted."""
+    start: float
+    end: float
+    text: str
+
+
+@dataclass(frozen=True, slots=True)
+class CueIndex:
     """
-    Returns the subtitle message for the current frame.
+    The cues of a file sorted by start, with the running max of their ends,
+    so the cues showing at a given time are found by bisection instead of a full scan.
     """
+    cues: tuple[Cue, ...]
+    positions: tuple[int, ...] # position of each cue in the file
+    starts: tuple[float, ...]
+    max_ends: tuple[float, ...] # max_ends[i] = max(cue.end for cue in cues[:i + 1])
+
+    @classmethod
+    def build(cls, cues: list[Cue]) -> "CueIndex":
+        order = sorted(range(len(cues)), key=lambda i: cues[i].start)
+        max_ends, max_end = [], float("-inf")
+        for i in order:
+            max_end = max(max_end, cues[i].end)
+            max_ends.append(max_end)
+        return cls(
+            cues=tuple(cues[i] for i in order),
+            positions=tuple(order),
+            starts=tuple(cues[i].start for i in order),
+            max_ends=tuple(max_ends),
+        )
 
-    img_fps = configs.get("episodes", {}).get(current_episode, {}).get("img_fps", 0)
+    def at(self, seconds: float) -> list[Cue]:
+        """Cues with start <= seconds <= end, in the order they appear in the file."""
+        # cues before low all end before seconds, cues from high on all start after it
+        low = bisect_left(self.max_ends, seconds)
+        high = bisect_right(self.starts, seconds)
+        hits = [(self.positions[i], self.cues[i]) for i in range(low, high) if self.cues[i].end >= seconds]
+        return [cue for _, cue in sorted(hits)]
 
-    if not img_fps:
-        logger.error("Error, img_fps not set, please define img_fps in the configs.yml file", exc_info=True)
-        return None
 
-    frame_in_seconds = timestamp_to_seconds(frame_to_timestamp(img_fps, current_frame))
+def format_cue_text(style: str, name: str, text: str) -> str:
+    """Clean the tags of a dialogue text and mark signs and songs."""
+    # Verifica se o estilo é relacionado a sinais (Signs)
+    if SIGNS_RE.match(style) or SIGNS_RE.match(name):
+        return f"【 {remove_tags(text)} 】\n"
 
-    with open(subtitle_file, "r", encoding="utf-8_sig") as file:
-        content = file.readlines()
+    # Verifica se o estilo ou o nome é relacionado a letras de música (Lyrics ou Songs)
+    if LYRICS_RE.search(style) or LYRICS_RE.search(name):
+        return f"♪ {remove_tags(text)} ♪\n"
 
-    dialogues = [line for line in content if line.startswith("Dialogue:")]
-    lang_name = language_detect(Path(subtitle_file), dialogues)
-    subtitles = []
+    # Caso contrário, apenas adiciona o texto
+    return remove_tags(text) + "\n"
+
+
+@lru_cache(maxsize=64)
+def _parse_subtitle_file(subtitle_file: Path, mtime_ns: int) -> tuple[tuple[str, ...], CueIndex]:
+    """Parse an .ass file once; mtime_ns is part of the cache key so an updated file is parsed again."""
+    # only the Dialogue lines are kept, the file is filtered while it is read
+    with open(subtitle_file, "r", encoding="utf-8_sig") as file:
+        dialogues = tuple(line for line in file if line.startswith("Dialogue:"))
+    cues = []
 
     for line in dialogues:
-        parts = line.split(",")
+        # Layer, Start, End, Style, Name, MarginL, MarginR, MarginV, Effect, Text:
+        # Text is the 10th field and may contain commas, so stop splitting before it
+        parts = line.split(",", 9)
+        if len(parts) < 10:
+            logger.warning(f"Skipping malformed Dialogue line in {subtitle_file.name}: {line.strip()}")
+            continue
         start_time_seconds = timestamp_to_seconds(parts[1])
         end_time_seconds = timestamp_to_seconds(parts[2])
         style = parts[3]  # Estilo (por exemplo, "Lyrics" ou "Signs")
         name = parts[4]  # Nome (opcional, usado em alguns casos)
-        text = line.split(",,")[-1]  # O texto da legenda
-
-        if start_time_seconds <= frame_in_seconds <= end_time_seconds:
-            # Verifica se o estilo é relacionado a sinais (Signs)
-            if re.match(r"(?i)^signs?", style) or re.match(r"(?i)^signs?", name):
-                subtitle = f"【 {remove_tags(text)} 】"
-                subtitles.append(subtitle + "\n")
-
-            # Verifica se o estilo ou o nome é relacionado a letras de música (Lyrics ou Songs)
-            elif re.search(r"(?i)lyrics?|songs?", style) or re.search(r"(?i)lyrics?|songs?", name):
-                subtitle = f"♪ {remove_tags(text)} ♪\n"
-                subtitles.append(subtitle)
-
-            # Caso contrário, apenas adiciona o texto
-            else:
-                subtitle = remove_tags(text)
-                subtitles.append(subtitle + "\n")
-    if not subtitles:
-        return None
+        text = parts[9]  # O texto da legenda
+        cues.append(Cue(start_time_seconds, end_time_seconds, format_cue_text(style, name, text)))
 
-    return f"[{lang_name}]\n {' '.join(subtitles)}"
+    return dialogues, CueIndex.build(cues)
 
 
-def get_subtitle_message(current_frame: int, current_episode: int, configs: dict) -> str | None:
+def parse_subtitle_file(subtitle_file: Path) -> tuple[tuple[str, ...], CueIndex]:
+    """
+    Return the Dialogue lines and the index of the parsed cues of an .ass file.
+    Memoized per process, so frames of the same episode don't parse the file again.
+    """
+    subtitle_file = Path(subtitle_file)
+    return _parse_subtitle_file(subtitle_file, subtitle_file.stat().st_mtime_ns)
+
+
+@lru_cache(maxsize=64)
+def _subtitle_files(subtitle_dir: Path, mtime_ns: int) -> tuple[Path, ...]:
+    """List the .ass files of a directory; mtime_ns is part of the cache key, see subtitle_files."""
+    return tuple(f for f in subtitle_dir.iterdir() if f.is_file() and f.suffix == ".ass")
+
+
+def subtitle_files(subtitle_dir: Path) -> tuple[Path, ...]:
+    """
+    Return the .ass files of an episode's subtitle directory, or () if it doesn't exist.
+    The listing is reused while the directory's mtime is unchanged, which a download
+    or language_detect renaming a file both change.
+    """
+    try:
+        mtime_ns = subtitle_dir.stat().st_mtime_ns
+    except FileNotFoundError:
+        return ()
+    return _subtitle_files(subtitle_dir, mtime_ns)
+
+
+def subtitle_ass(subtitle_file: str, current_frame: int, current_episode: int, configs: dict) -> str | None:
     """
     Returns the subtitle message for the current frame.
     """
-    
-    if not isinstance(current_frame, int) or not isinstance(current_episode, int):
-        print(f"Error, current_frame and current_episode must be integers. ({__name__})", exc_info=True)
+
+    episode_data = get_episodes(configs).get(current_episode)
+    img_fps = episode_data.img_fps if episode_data else 0
+
+    if not img_fps:
+        logger.error("Error, img_fps not set, please define img_fps in the configs.yml file", exc_info=True)
         return None
 
-    subtitles_dir = Path.cwd() / "subtitles"
-    subtitle_dir = subtitles_dir / f"{current_episode:02d}"
+    frame_in_seconds = current_frame / img_fps
+
+    dialogues, cue_index = parse_subtitle_file(subtitle_file)
+    lang_name = language_detect(Path(subtitle_file), dialogues)
+    subtitles = [cue.text for cue in cue_index.at(frame_in_seconds)]
 
-    if not subtitle_dir.exists():
-        print(f"Subtitles active, but not found in directory {subtitle_dir}. ({__name__})", exc_info=True)
+    if not subtitles:
         return None
 
-    files = [f for f in subtitle_dir.iterdir() if f.is_file() and f.suffix == ".ass"]
-    if not configs.get("posting", {}).get("multi_language_subtitles", False):
-        files = [files[0]]
+    return f"[{lang_name}]\n {' '.join(subtitles)}"
+
 
-    if not files:
-        print(f"Subtitles active, but not found in directory {subtitle_dir}. ({__name__})", exc_info=True)
+def get_subtitle_message(current_frame: int, current_episode: int, configs: dict) -> str | None:
+    """
+    Returns the subtitle message for the current frame.
+    """
+    
+    if not isinstance(current_frame, int) or not isinstance(current_episode, int):
+        logger.error(f"Error, current_frame and current_episode must be integers. ({__name__})")
         return None
 
+    subtitle_dir = Path.cwd() / "subtitles" / f"{current_episode:02d}"
     message = ""
 
-    for file in files:
-        subtitle_file = subtitle_dir / file
+    # listed and read under the episode lock: subtitle_ass may rename a file (language_detect)
+    # while frames of the same episode are prepared in other threads
+    with episode_locks.setdefault(current_episode, threading.Lock()):
+        files = subtitle_files(subtitle_dir)
+        if not files:
+            logger.error(f"Subtitles active, but not found in directory {subtitle_dir}. ({__name__})")
+            return None
+
+        if not configs.get("posting", {}).get("multi_language_subtitles", False):
+            files = files[:1]
 
-        result = subtitle_ass(subtitle_file, current_frame, current_episode, configs)
-        if result:
-            message += result + "\n\n"
+        for subtitle_file in files:
+            result = subtitle_ass(subtitle_file, current_frame, current_episode, configs)
+            if result:
+                message += result + "\n\n"
 
     return "𝑺𝒖𝒃𝒕𝒊𝒕𝒍𝒆𝒔:\n" + message if message else None
\ No newline at end of file